@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GitjsConfig(AppConfig):
     name = 'GitJS'
     verbose_name = 'Github clone'
+
+    def ready(self):
+        from . import signals
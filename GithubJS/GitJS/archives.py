@@ -0,0 +1,98 @@
+import tarfile
+import zipfile
+
+from django.core.cache import cache
+
+from .models import CACHE_TTL
+
+ARCHIVE_FORMATS = {'zip': 'application/zip', 'tar.gz': 'application/gzip'}
+# archives up to this size are cached whole, larger ones are built again for every download
+ARCHIVE_CACHE_SIZE = 10 * 1024 * 1024
+ARCHIVE_FILES_PER_QUERY = 100
+
+
+class _Output:
+    # unseekable file the archive writers write into, emptied after every archived file
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class _Input:
+    # file over the chunks of a blob, tarfile reads the contents it adds
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _entry_name(title):
+    # titles are free text, nothing in them may point outside of the extracted archive
+    return '/'.join(part for part in title.split('/') if part not in ('', '.', '..')) or '_'
+
+
+def stream_archive(branch, archive_format):
+    output = _Output()
+    # the data of large blobs is read a slice at a time by their chunks
+    files = branch.get_files().select_related('blob').defer('blob__data') \
+        .iterator(chunk_size=ARCHIVE_FILES_PER_QUERY)
+    if archive_format == 'zip':
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for file in files:
+                info = zipfile.ZipInfo(_entry_name(file.title))
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with archive.open(info, 'w', force_zip64=file.blob.size > zipfile.ZIP64_LIMIT) as entry:
+                    for chunk in file.blob.chunks():
+                        entry.write(chunk)
+                yield output.pop()
+    else:
+        with tarfile.open(fileobj=output, mode='w|gz') as archive:
+            for file in files:
+                info = tarfile.TarInfo(_entry_name(file.title))
+                info.size = file.blob.size
+                archive.addfile(info, _Input(file.blob.chunks()))
+                yield output.pop()
+    yield output.pop()
+
+
+def cached_archive(key, chunks):
+    # passes the archive on, keeping a copy for the cache while it stays small enough
+    kept = []
+    size = 0
+    for chunk in chunks:
+        if kept is not None:
+            kept.append(chunk)
+            size += len(chunk)
+            if size > ARCHIVE_CACHE_SIZE:
+                kept = None
+        yield chunk
+    if kept is not None:
+        cache.set(key, b''.join(kept), CACHE_TTL)
@@ -1,15 +1,17 @@
 from django.http import HttpResponseRedirect, Http404
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse
 
-from .models import Project, Branch, File, Commit
+from .models import Project, Branch, CACHE_TTL, FEED_PAGE_SIZE
+from .object_cache import get_cached_object_or_404, get_generation
+from .paging import get_cursor
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def add_branch(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
+    project = get_cached_object_or_404(Project, project_id)
     if request.method == 'GET':
         return render(request, "branch_form.html", {"project": project, "title": "New branch", "input_value": "",
                                                     "form_action": str(project_id)+"/add_branch/"})
@@ -20,8 +22,7 @@ def add_branch(request, project_id):
             return render(request, "branch_form.html", {"project": project, "error_message": error_message,
                                                         "title": "Error!", "input_value": "",
                                                         "form_action": str(project_id)+"/add_branch/"})
-        new_id = Branch.objects.all().order_by('-id')[0].id + 1
-        b = Branch(id=new_id, name=new_branch_name)
+        b = Branch(name=new_branch_name)
         is_default = len(Branch.objects.filter(project=project)) == 0
         b.default = is_default
         b.project = project
@@ -41,10 +42,10 @@ def add_branch(request, project_id):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def delete_branch(request, branch_id):
-    branch = get_object_or_404(Branch, id=branch_id)
+    branch = get_cached_object_or_404(Branch, branch_id)
     project_id = branch.project.id
     is_default = branch.default
-    if not branch.project.can_edit(request.user.username):
+    if not branch.project.can_edit(request.user):
         raise Http404()
     branch.delete()
 
@@ -59,7 +60,7 @@ def delete_branch(request, branch_id):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def edit_branch(request, branch_id):
-    branch = get_object_or_404(Branch, id=branch_id)
+    branch = get_cached_object_or_404(Branch, branch_id)
     if request.method == 'GET':
         return render(request, "branch_form.html", {"project": branch.project, "title": branch.name,
                                                     "input_value": branch.name,
@@ -80,35 +81,40 @@ def edit_branch(request, branch_id):
                                                             "form_action": "edit_branch/"+str(branch_id)})
         branch.project.update_users('Branch ' + branch.name + ' changed to ' + new_branch_name)
         branch.name = new_branch_name
-        branch.save()
+        # the row may come from the cache, only the changed field is written over the commit count
+        branch.save(update_fields=['name'])
         return HttpResponseRedirect(reverse("single_project", args=(branch.project.id,)))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def get_commit_history(request, branch_id):
-    branch = get_object_or_404(Branch, id=branch_id)
-    return render(request, "commits.html", {'commits': branch.get_commits(), 'branch': branch})
+    branch = get_cached_object_or_404(Branch, branch_id)
+    # the commits are only read when their fragment isn't cached
+    before = get_cursor(request)
+    return render(request, "commits.html", {'commits': branch.get_commit_page(before), 'branch': branch,
+                                            'before': before, 'page_size': FEED_PAGE_SIZE, 'cache_ttl': CACHE_TTL,
+                                            'generation': get_generation(Branch, branch.id)})
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def set_default(request, branch_id):
-    branch = get_object_or_404(Branch, id=branch_id)
+    branch = get_cached_object_or_404(Branch, branch_id)
 
     current_default = Branch.objects.get(project=branch.project, default=True)
     current_default.default = False
-    current_default.save()
+    current_default.save(update_fields=['default'])
 
     branch.default = True
-    branch.save()
+    branch.save(update_fields=['default'])
     return HttpResponseRedirect(reverse("single_project", args=(branch.project.id,)))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def copy_branch(request, branch_id):
-    branch = get_object_or_404(Branch, id=branch_id)
+    branch = get_cached_object_or_404(Branch, branch_id)
 
     if request.method == 'GET':
         return render(request, "branch_form.html", {"project": branch.project, "input_value": '',
@@ -132,19 +138,5 @@ def copy_branch(request, branch_id):
                                                         'is_copy': True,
                                                         "form_action": "copy_branch/" + str(branch_id)})
 
-        new_id = Branch.objects.all().order_by('-id')[0].id + 1
-        new_branch = Branch(id=new_id, name=new_branch_name, project=branch.project, default=False)
-        new_branch.save()
-
-        for file in branch.get_files():
-            new_file_id = File.objects.all().order_by('-id')[0].id + 1
-            new_file = File(id=new_file_id, branch=new_branch, title=file.title, text=file.text)
-            new_file.save()
-
-        for commit in branch.get_commits():
-            new_commit_id = Commit.objects.all().order_by('-id')[0].id + 1
-            new_commit = Commit(id=new_commit_id, branch=new_branch, log_message=commit.log_message,
-                                date_time=commit.date_time, committer=commit.committer)
-            new_commit.save()
-
+        branch.copy(new_branch_name, branch.project)
         return HttpResponseRedirect(reverse("single_project", args=(branch.project.id,)))
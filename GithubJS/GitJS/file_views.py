@@ -1,28 +1,92 @@
+import re
+
+from django.core.cache import cache
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
 
-from django.http import HttpResponseRedirect
-from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, HttpResponseRedirect, \
+    Http404, StreamingHttpResponse
+from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse
+from django.views.decorators.http import require_POST
+
+from .archives import ARCHIVE_FORMATS, cached_archive, stream_archive
+from .models import Blob, Branch, File, Commit, Project, CACHE_TTL
+from .object_cache import get_cached_object_or_404, get_generation
+
+
+def _get_branch(branch_id):
+    # the branch with its project, both usually from the object cache
+    branch = get_cached_object_or_404(Branch, branch_id)
+    branch.project = get_cached_object_or_404(Project, branch.project_id)
+    return branch
+
+
+def _get_file_branch(request, file):
+    # a file shared by a branch copy is opened from the copy, passed along as the branch parameter
+    branch_id = request.GET.get('branch', '')
+    branch = _get_branch(int(branch_id) if branch_id.isdigit() else file.branch_id)
+    if branch.get_file_by_title(file.title) != file:
+        raise Http404()
+    return branch
+
 
-from .models import Branch, File, Commit
+def _get_range(request, size):
+    # a single 'bytes=start-end' range of the Range header, None when the whole file is wanted;
+    # a range ending before its start is invalid and ignored like any other malformed header
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', request.META.get('HTTP_RANGE', '').strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        return max(size - int(end), 0), size - 1
+    if end and int(end) < int(start):
+        return None
+    return int(start), (min(int(end), size - 1) if end else size - 1)
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def single_branch(request, branch_id):
-    branch = get_object_or_404(Branch, id=branch_id)
-    can_edit = branch.project.can_edit(request.user.username)
+    branch = _get_branch(branch_id)
+    can_edit = branch.project.can_edit(request.user)
     return render(request, 'branch_view.html', {"branch": branch, "title": "Single branch",
-                                                'can_edit': can_edit})
+                                                'can_edit': can_edit, 'cache_ttl': CACHE_TTL,
+                                                'generation': get_generation(Branch, branch.id)})
+
+
+@login_required(login_url='login/')
+@permission_required('GitJS.can_view', raise_exception=True)
+def branch_archive(request, branch_id, archive_format):
+    branch = _get_branch(branch_id)
+    if archive_format not in ARCHIVE_FORMATS:
+        raise Http404()
+    snapshot = branch.get_snapshot()
+    etag = quote_etag(snapshot + '.' + archive_format)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    # branches with the same files share the archive
+    key = 'archive:' + archive_format + ':' + snapshot
+    archive = cache.get(key)
+    content = [archive] if archive is not None else cached_archive(key, stream_archive(branch, archive_format))
+    response = StreamingHttpResponse(content, content_type=ARCHIVE_FORMATS[archive_format])
+    filename = re.sub(r'[^\w.-]', '_', branch.project.title + '-' + branch.name) + '.' + archive_format
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def add_file(request, branch_id):
-    branch = get_object_or_404(Branch, id=branch_id)
-    can_edit = branch.project.can_edit(request.user.username)
-    if request.user.username not in branch.project.get_all_participants():
+    branch = _get_branch(branch_id)
+    can_edit = branch.project.can_edit(request.user)
+    if not can_edit:
         return HttpResponseRedirect(reverse("single_branch", args=(branch_id,)))
     if request.method == 'GET':
         return render(request, "file_edit.html", {"branch": branch, "title": "New file", "file_title": "",
@@ -37,74 +101,126 @@ def add_file(request, branch_id):
                                                       "error_message": error_message,
                                                       "file_text": "", "form_action": str(branch_id)+"/add_file",
                                                       'can_edit': can_edit})
-        new_id = len(File.objects.all())+1
-        f = File(id=new_id, title=file_title, text=file_text)
-        f.branch = branch
-        try:
-            existing_file = File.objects.get(title=file_title, branch=branch)
+        if branch.get_file_by_title(file_title) is not None:
             error_message = "File with given title already exists"
             return render(request, "file_edit.html", {"branch": branch, "error_message": error_message,
                                                       "title": "Error!", "file_title": "", "file_text": "",
                                                       "form_action": str(branch_id)+"/add_file",
                                                       'can_edit': can_edit})
-        except:
-            f.save()
-            new_commit_id = Commit.objects.all().order_by('-id')[0].id + 1
-            commit = Commit(id=new_commit_id, branch=branch, committer=request.user.username, date_time=timezone.now())
-            commit.log_message = 'File '+f.title+' added'
-            commit.save()
-            return HttpResponseRedirect(reverse("single_branch", args=(branch_id,)))
+        f = branch.add_file(file_title, file_text)
+        commit = Commit(branch=branch, committer=request.user.username, date_time=timezone.now())
+        commit.log_message = 'File '+f.title+' added'
+        commit.save()
+        return HttpResponseRedirect(reverse("single_branch", args=(branch_id,)))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def edit_file(request, file_id):
-    file = get_object_or_404(File, id=file_id)
-    can_edit = file.branch.project.can_edit(request.user.username)
+    file = get_cached_object_or_404(File, file_id)
+    branch = _get_file_branch(request, file)
+    form_action = "edit_file/" + str(file_id) + "?branch=" + str(branch.id)
+    can_edit = branch.project.can_edit(request.user)
     if request.method == 'GET':
-        return render(request, "file_edit.html", {"branch": file.branch, "title": "Edit file", "file_title": file.title,
-                                                  "file_text": file.text, "form_action": "edit_file/" + str(file_id),
+        return render(request, "file_edit.html", {"branch": branch, "title": "Edit file", "file_title": file.title,
+                                                  "file_text": file.blob.read(), "form_action": form_action,
                                                   'can_edit': can_edit})
     else:
         file_title = request.POST['new_title'].strip()
         file_text = request.POST['new_text'].strip()
         if file_title == '':
             error_message = "File title can't be empty"
-            return render(request, "file_edit.html", {"branch": file.branch, "title": "Error!",
-                                                      "file_title": file.title, "file_text": file.text,
+            return render(request, "file_edit.html", {"branch": branch, "title": "Error!",
+                                                      "file_title": file.title, "file_text": file.blob.read(),
                                                       "error_message": error_message,
-                                                      "form_action": "edit_file/" + str(file_id),
+                                                      "form_action": form_action,
                                                       'can_edit': can_edit})
-        existing_files = File.objects.filter(title=file_title, branch=file.branch)
-        if len(existing_files) > 0:
-            if existing_files[0].id != file_id:
+        existing_file = branch.get_file_by_title(file_title)
+        if existing_file is not None:
+            if existing_file.id != file_id:
                 error_message = "File with given title already exists"
-                return render(request, "file_edit.html", {"branch": file.branch, "title": "Error!",
-                                                          "file_title": file.title, "file_text": file.text,
+                return render(request, "file_edit.html", {"branch": branch, "title": "Error!",
+                                                          "file_title": file.title, "file_text": file.blob.read(),
                                                           "error_message": error_message,
-                                                          "form_action": "edit_file/" + str(file_id),
+                                                          "form_action": form_action,
                                                           'can_edit': can_edit})
-        new_commit_id = Commit.objects.all().order_by('-id')[0].id + 1
-        commit = Commit(id=new_commit_id, branch=file.branch, committer=request.user.username,
-                        date_time=timezone.now())
+        commit = Commit(branch=branch, committer=request.user.username, date_time=timezone.now())
         commit.log_message = 'File ' + file.title + ' changed'
-        file.title = file_title
-        file.text = file_text
-        file.save()
+        branch.change_file(file, file_title, file_text)
         commit.save()
-        return HttpResponseRedirect(reverse("single_branch", args=(file.branch.id,)))
+        return HttpResponseRedirect(reverse("single_branch", args=(branch.id,)))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def delete_file(request, file_id):
-    file = get_object_or_404(File, id=file_id)
-    if request.user.username not in file.branch.project.get_all_participants():
-        return HttpResponseRedirect(reverse("single_branch", args=(file.branch.id,)))
-    new_commit_id = Commit.objects.all().order_by('-id')[0].id + 1
-    commit = Commit(id=new_commit_id, branch=file.branch, committer=request.user.username,
-                    date_time=timezone.now())
+    file = get_cached_object_or_404(File, file_id)
+    branch = _get_file_branch(request, file)
+    if not branch.project.can_edit(request.user):
+        return HttpResponseRedirect(reverse("single_branch", args=(branch.id,)))
+    commit = Commit(branch=branch, committer=request.user.username, date_time=timezone.now())
     commit.log_message = 'File ' + file.title + ' deleted'
-    file.delete()
+    branch.remove_file(file)
+    commit.save()
+    return HttpResponseRedirect(reverse("single_branch", args=(branch.id,)))
+
+
+@login_required(login_url='login/')
+@permission_required('GitJS.can_view', raise_exception=True)
+def raw_file(request, file_id):
+    file = get_cached_object_or_404(File, file_id)
+    _get_file_branch(request, file)
+    # contents are stored under their hash, which makes it a strong etag
+    etag = quote_etag(file.blob_id)
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    # the data of large blobs is streamed a slice at a time instead of loaded with the row
+    blob = Blob.objects.defer('data').get(sha256=file.blob_id)
+    byte_range = _get_range(request, blob.size)
+    if byte_range is None:
+        response = StreamingHttpResponse(blob.chunks(), content_type='text/plain; charset=utf-8')
+        response['Content-Length'] = blob.size
+    else:
+        start, end = byte_range
+        if start >= blob.size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % blob.size
+            return response
+        response = StreamingHttpResponse(blob.byte_range(start, end), status=206,
+                                         content_type='text/plain; charset=utf-8')
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, blob.size)
+        response['Content-Length'] = end - start + 1
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required(login_url='login/')
+@permission_required('GitJS.can_edit', raise_exception=True)
+@require_POST
+def upload_file(request, branch_id):
+    branch = _get_branch(branch_id)
+    if not branch.project.can_edit(request.user):
+        return HttpResponseRedirect(reverse("single_branch", args=(branch_id,)))
+    if 'file' not in request.FILES:
+        return HttpResponseBadRequest('No file was uploaded')
+    upload = request.FILES['file']
+    file_title = request.POST.get('new_title', '').strip() or upload.name
+    if len(file_title) > File._meta.get_field('title').max_length:
+        return HttpResponseBadRequest('File title is too long')
+    # large uploads are spooled to disk by django and read back a chunk at a time
+    try:
+        blob = Blob.from_chunks(upload.chunks())
+    except UnicodeDecodeError:
+        return HttpResponseBadRequest('Only text files can be uploaded')
+    replaced = branch.get_file_by_title(file_title) is not None
+    f = branch.upload_file(file_title, blob)
+    commit = Commit(branch=branch, committer=request.user.username, date_time=timezone.now())
+    commit.log_message = 'File ' + f.title + (' changed' if replaced else ' added')
     commit.save()
-    return HttpResponseRedirect(reverse("single_branch", args=(file.branch.id,)))
+    return HttpResponseRedirect(reverse("single_branch", args=(branch_id,)))
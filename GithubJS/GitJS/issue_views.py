@@ -1,16 +1,17 @@
 from django.http import HttpResponseRedirect
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse
 
 from .models import Project, GitUser, Issue, Milestone
+from .object_cache import get_cached_object_or_404
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def get_issues(request, project_id, state):
-    project = get_object_or_404(Project, id=project_id)
-    can_edit = project.can_edit(request.user.username)
+    project = get_cached_object_or_404(Project, project_id)
+    can_edit = project.can_edit(request.user)
     return render(request, 'issues.html', {'title': 'Issues for ' + project.title, 'project_id': project_id,
                                            'issues': project.get_issues(state), 'can_edit': can_edit})
 
@@ -18,8 +19,8 @@ def get_issues(request, project_id, state):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def get_milestone_issues(request, milestone_id, state):
-    milestone = get_object_or_404(Milestone, id=milestone_id)
-    can_edit = milestone.project.can_edit(request.user.username)
+    milestone = get_cached_object_or_404(Milestone, milestone_id)
+    can_edit = milestone.project.can_edit(request.user)
     return render(request, 'issues.html', {'title': 'Issues for ' + milestone.title, 'milestone_id': milestone.id,
                                            'issues': milestone.get_issues(state), 'can_edit': can_edit,
                                            'project': milestone.project})
@@ -28,8 +29,8 @@ def get_milestone_issues(request, milestone_id, state):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def add_issue(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    can_edit = project.can_edit(request.user.username)
+    project = get_cached_object_or_404(Project, project_id)
+    can_edit = project.can_edit(request.user)
     if request.method == 'GET':
         return render(request, 'issue_form.html', {'title': 'New issue', 'project_id': project_id,
                                                    'form_action': str(project_id) + '/add_issue',
@@ -70,8 +71,7 @@ def add_issue(request, project_id):
                                                        'project_id': project_id,
                                                        'can_edit': can_edit
                                                        })
-        new_id = Issue.objects.all().order_by('-id')[0].id + 1
-        issue = Issue(id=new_id, title=new_title, description=new_desc, project=project, state='OPEN')
+        issue = Issue(title=new_title, description=new_desc, project=project, state='OPEN')
         if milestone != 'None':
             issue.milestone = Milestone.objects.get(title=milestone)
         if assignee != 'None':
@@ -84,10 +84,10 @@ def add_issue(request, project_id):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def edit_issue(request, issue_id):
-    issue = get_object_or_404(Issue, id=issue_id)
+    issue = get_cached_object_or_404(Issue, issue_id)
     old_assignee = issue.assignee.username if issue.assignee else 'None'
     old_milestone = issue.milestone.title if issue.milestone else 'None'
-    can_edit = issue.project.can_edit(request.user.username)
+    can_edit = issue.project.can_edit(request.user)
     if request.method == 'GET':
         return render(request, 'issue_form.html', {'title': 'Issue #'+str(issue_id), 'project_id': issue.project.id,
                                                    'form_action': 'edit_issue/' + str(issue_id),
@@ -150,7 +150,7 @@ def edit_issue(request, issue_id):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def toggle_issue_status(request, issue_id):
-    issue = get_object_or_404(Issue, id=issue_id)
+    issue = get_cached_object_or_404(Issue, issue_id)
     if issue.state == 'OPEN':
         issue.state = 'CLOSED'
         issue.project.update_users('Issue ' + issue.title + ' closed in ' + issue.project.title)
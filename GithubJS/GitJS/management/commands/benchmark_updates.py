@@ -0,0 +1,76 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from ...models import Project, GitUser, WatchedProject, ProjectUpdate, ProjectEvent, deliver_queued_updates, \
+    BULK_BATCH_SIZE
+
+
+class Command(BaseCommand):
+
+    help = 'Compares storing watched project changes per watcher and merging project events on read, ' \
+           'on synthetic data that is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        # the defaults are the size this was measured at, on sqlite; larger runs are a matter of the options
+        parser.add_argument('--projects', type=int, default=100)
+        parser.add_argument('--watchers', type=int, default=1000)
+        parser.add_argument('--watched', type=int, default=10, help='Projects watched by every watcher')
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--samples', type=int, default=20, help='Watchers whose changes are read')
+
+    def _timed(self, label, action):
+        start = time.perf_counter()
+        action()
+        self.stdout.write('  %s: %.3f s' % (label, time.perf_counter() - start))
+
+    def _prepare(self, options):
+        lead = GitUser.objects.create_user('benchmark_lead', 'benchmark@mailinator.com', 'benchmark_lead')
+        Project.objects.bulk_create([Project(title='Benchmark ' + str(i), lead=lead)
+                                     for i in range(options['projects'])], batch_size=BULK_BATCH_SIZE)
+        projects = list(Project.objects.filter(lead=lead).order_by('id'))
+        # multi-table inherited users can't be bulk created, so the auth rows go in bulk
+        # and the git user rows are saved raw, without hashing a password for each one
+        User.objects.bulk_create([User(username='benchmark_watcher_' + str(user), password='!')
+                                  for user in range(options['watchers'])], batch_size=BULK_BATCH_SIZE)
+        watchers = list(User.objects.filter(username__startswith='benchmark_watcher_').order_by('id')
+                        .values_list('id', flat=True))
+        for user_id in watchers:
+            GitUser(user_ptr_id=user_id).save_base(raw=True)
+        WatchedProject.objects.bulk_create([
+            WatchedProject(user_id=user_id, project_id=projects[(user + k) % len(projects)].id)
+            for user, user_id in enumerate(watchers) for k in range(options['watched'])
+        ], batch_size=BULK_BATCH_SIZE)
+        return projects, watchers
+
+    def _run(self, mode, options):
+        self.stdout.write("Mode '%s':" % mode)
+        with override_settings(WATCHED_CHANGES_MODE=mode), transaction.atomic():
+            projects, watchers = self._prepare(options)
+
+            def write_events():
+                for i in range(options['events']):
+                    projects[i % len(projects)].update_users('Benchmark change ' + str(i))
+
+            def deliver():
+                while deliver_queued_updates() > 0:
+                    pass
+
+            def read_changes():
+                step = max(len(watchers) // options['samples'], 1)
+                for user_id in watchers[::step]:
+                    list(GitUser(id=user_id).get_watched_changes())
+
+            self._timed('write %d changes' % options['events'], write_events)
+            if mode == 'write':
+                self._timed('deliver to watchers', deliver)
+            self._timed('read changes of %d watchers' % options['samples'], read_changes)
+            self.stdout.write('  stored rows: %d' % (ProjectUpdate.objects.count() + ProjectEvent.objects.count()))
+            transaction.set_rollback(True)
+
+    def handle(self, *args, **options):
+        for mode in ['write', 'read']:
+            self._run(mode, options)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...models import deliver_queued_updates
+
+
+class Command(BaseCommand):
+
+    help = 'Delivers queued project updates to users watching the projects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep delivering until stopped')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            delivered = deliver_queued_updates()
+            while delivered > 0:
+                delivered = deliver_queued_updates()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -1,13 +1,15 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import Permission, Group
 from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection
 from django.utils import timezone
 
 import datetime
 
 from ...models import Project, Branch, GitUser, StarredProject,\
-    WatchedProject, ProjectUpdate, Milestone, File, Contributor, \
-    Comment, Reaction, Issue, Commit, PullRequest
+    WatchedProject, ProjectUpdate, ProjectEvent, QueuedUpdate, SearchPosting, Blob, Milestone, File, Contributor, \
+    Comment, Reaction, Issue, Commit, PullRequest, deliver_queued_updates
 
 
 class Command(BaseCommand):
@@ -63,8 +65,8 @@ class Command(BaseCommand):
         wp = WatchedProject(id=item_id, user_id=user_id, project_id=project_id)
         wp.save()
 
-    def _add_contributor(self, item_id, username, project_id):
-        c = Contributor(id=item_id, username=username, project_id=project_id)
+    def _add_contributor(self, item_id, user_id, project_id):
+        c = Contributor(id=item_id, user_id=user_id, project_id=project_id)
         c.save()
 
     def _add_projects(self):
@@ -72,6 +74,10 @@ class Command(BaseCommand):
         StarredProject.objects.all().delete()
         WatchedProject.objects.all().delete()
         ProjectUpdate.objects.all().delete()
+        QueuedUpdate.objects.all().delete()
+        ProjectEvent.objects.all().delete()
+        SearchPosting.objects.all().delete()
+        Blob.objects.all().delete()
         Contributor.objects.all().delete()
 
         p1 = Project(id=1, title="Project 1")
@@ -92,9 +98,9 @@ class Command(BaseCommand):
         self._add_watched(1, p1.lead.pk, p1.id)
         self._add_watched(2, p2.lead.pk, p1.id)
 
-        self._add_contributor(1, GitUser.objects.get_by_natural_key("user4").username, p1.id)
-        self._add_contributor(2, GitUser.objects.get_by_natural_key("user5").username, p1.id)
-        self._add_contributor(3, GitUser.objects.get_by_natural_key("user6").username, p2.id)
+        self._add_contributor(1, GitUser.objects.get_by_natural_key("user4").pk, p1.id)
+        self._add_contributor(2, GitUser.objects.get_by_natural_key("user5").pk, p1.id)
+        self._add_contributor(3, GitUser.objects.get_by_natural_key("user6").pk, p2.id)
 
     def _get_branch_message(self, branch):
         return 'Branch ' + branch.name + ' added to project ' + branch.project.title
@@ -401,6 +407,15 @@ class Command(BaseCommand):
         i8.milestone = Milestone.objects.get(id=1)
         i8.save()
 
+    def _reset_sequences(self):
+        # initial rows are inserted with explicit ids, which postgres sequences don't see,
+        # so move every sequence past the largest id before the app starts inserting
+        models = [Project, Branch, StarredProject, WatchedProject, ProjectUpdate, Milestone, File,
+                  Contributor, Comment, Reaction, Issue, Commit, PullRequest]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
     def handle(self, *args, **options):
         self._add_users()
         self._add_projects()
@@ -411,3 +426,6 @@ class Command(BaseCommand):
         self._add_reactions()
         self._add_issues()
         self._add_pull_requests()
+        self._reset_sequences()
+        while deliver_queued_updates() > 0:
+            pass
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from .fill_database import Command as FillDatabase
+from ...profiling import BASELINE, baseline_counts, profile_views, growing_views
+
+# every profiled request starts from an empty cache of its own, the shared one is left alone
+PROFILE_SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'profile_views'}},
+}
+
+
+class Command(BaseCommand):
+
+    help = 'Requests every GitJS route on synthetic data of growing size, rolled back afterwards, and reports ' \
+           'query counts, SQL time and response time per view; fails when a query count grows with the data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, action='append',
+                            help='Rows of every kind added before profiling, 1 and 10 by default')
+        parser.add_argument('--output', help='File the profile with its timings is written to as json, standard '
+                                             'output by default; query_profile.json is ignored by git')
+        parser.add_argument('--baseline', action='store_true',
+                            help='Writes only the query counts, the part of the profile that is the same on every '
+                                 'machine, to the baseline checked by the tests')
+
+    def handle(self, *args, **options):
+        with override_settings(**PROFILE_SETTINGS), transaction.atomic():
+            FillDatabase().handle()
+            profile = profile_views(options['scale'] or [1, 10])
+            transaction.set_rollback(True)
+
+        if options['baseline']:
+            with open(BASELINE, 'w') as baseline:
+                baseline.write(json.dumps(baseline_counts(profile), indent=2, sort_keys=True) + '\n')
+
+        report = json.dumps(profile, indent=2, sort_keys=True) + '\n'
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+        else:
+            self.stdout.write(report, ending='')
+
+        growing = growing_views(profile)
+        if growing:
+            raise CommandError('Query counts grow with the data in: ' + ', '.join(growing))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from ...models import Blob, File
+
+
+class Command(BaseCommand):
+
+    help = 'Deletes stored file contents that no file refers to anymore'
+
+    def handle(self, *args, **options):
+        deleted, _ = Blob.objects.filter(~Exists(File.objects.filter(blob_id=OuterRef('pk')))).delete()
+        self.stdout.write('Deleted %d blobs' % deleted)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import SearchPosting, SEARCH_INDEXED, add_search_postings, search_index_rows
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuilds the word index of files, issues, pull requests and comments used when SEARCH_INDEX is on'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=list(SEARCH_INDEXED),
+                            help='Kind of text to rebuild, all of them by default')
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or SEARCH_INDEXED:
+            model, fields = SEARCH_INDEXED[kind]
+            indexed = model.objects.order_by()
+            if kind == 'files':
+                # tombstones of deleted files are never found
+                indexed = indexed.filter(deleted=False)
+            with transaction.atomic():
+                SearchPosting.objects.filter(kind=kind).delete()
+                add_search_postings(kind, search_index_rows(kind, indexed))
+            self.stdout.write('%s: %d words' % (kind, SearchPosting.objects.filter(kind=kind).count()))
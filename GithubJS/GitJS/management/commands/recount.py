@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import Project, Milestone, Branch, recount
+from ...object_cache import bump_generation, uncache_objects
+
+
+class Command(BaseCommand):
+
+    help = 'Counts branches, issues, pull requests, stars, watchers and commits again and repairs the stored ' \
+           'counters of projects, milestones and branches that drifted'
+
+    def handle(self, *args, **options):
+        for model in [Project, Milestone, Branch]:
+            fields = [field.name for field in model._meta.concrete_fields if field.name.endswith('_count')]
+            with transaction.atomic():
+                rows = model.objects.select_for_update().order_by('id').values_list('id', *fields)
+                before = set(rows)
+                recount(model.objects.all())
+                repaired = [row[0] for row in rows.all() if row not in before]
+                uncache_objects(model, repaired)
+                for pk in repaired:
+                    bump_generation(model, pk)
+            self.stdout.write('%s counters: %d of %d repaired' %
+                              (model._meta.verbose_name, len(repaired), len(before)))
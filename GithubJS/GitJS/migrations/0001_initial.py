@@ -0,0 +1,357 @@
+# Generated by Django 3.2.7 on 2026-10-18 16:06
+
+import django.contrib.auth.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('text', models.TextField(blank=True)),
+                ('data', models.BinaryField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('default', models.BooleanField()),
+                ('base_file_id', models.BigIntegerField(null=True)),
+                ('base_commit_id', models.BigIntegerField(null=True)),
+                ('commit_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=200)),
+                ('last_update', models.DateTimeField(verbose_name='last update')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Commit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('log_message', models.CharField(max_length=200)),
+                ('date_time', models.DateTimeField(verbose_name='date committed')),
+                ('committer', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Contributor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='File',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('deleted', models.BooleanField(default=False)),
+                ('replaced_by', models.BigIntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GitUser',
+            fields=[
+                ('user_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='auth.user')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+            bases=('auth.user',),
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Issue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('description', models.CharField(max_length=200)),
+                ('state', models.CharField(max_length=7)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Milestone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('description', models.CharField(max_length=200)),
+                ('due_date', models.DateTimeField(verbose_name='due date')),
+                ('state', models.CharField(max_length=7)),
+                ('open_issue_count', models.IntegerField(default=0)),
+                ('closed_issue_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Project',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('branch_count', models.IntegerField(default=0)),
+                ('open_issue_count', models.IntegerField(default=0)),
+                ('closed_issue_count', models.IntegerField(default=0)),
+                ('open_pull_request_count', models.IntegerField(default=0)),
+                ('star_count', models.IntegerField(default=0)),
+                ('watcher_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('up_date', models.DateTimeField(verbose_name='date updated')),
+                ('message', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('up_date', models.DateTimeField(verbose_name='date updated')),
+                ('message', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PullRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(max_length=7)),
+                ('title', models.CharField(max_length=100)),
+                ('description', models.CharField(max_length=200)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QueuedUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('up_date', models.DateTimeField(verbose_name='date updated')),
+                ('message', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('word', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('count', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WatchedProject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.gituser')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StarredProject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.gituser')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchposting',
+            index=models.Index(fields=['kind', 'word', 'object_id'], name='GitJS_searc_kind_9df2b6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchposting',
+            index=models.Index(fields=['kind', 'object_id'], name='GitJS_searc_kind_4d7332_idx'),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='comment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.comment'),
+        ),
+        migrations.AddField(
+            model_name='reaction',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.gituser'),
+        ),
+        migrations.AddField(
+            model_name='queuedupdate',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='pullrequest',
+            name='issue',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='GitJS.issue'),
+        ),
+        migrations.AddField(
+            model_name='pullrequest',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='pullrequest',
+            name='source',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='source', to='GitJS.branch'),
+        ),
+        migrations.AddField(
+            model_name='pullrequest',
+            name='target',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='target', to='GitJS.branch'),
+        ),
+        migrations.AddField(
+            model_name='projectupdate',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='projectupdate',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='GitJS.gituser'),
+        ),
+        migrations.AddField(
+            model_name='projectevent',
+            name='project',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='forked_from',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='lead',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.gituser'),
+        ),
+        migrations.AddField(
+            model_name='milestone',
+            name='project',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='assignee',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='GitJS.gituser'),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='milestone',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='GitJS.milestone'),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='GitJS.blob'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.branch'),
+        ),
+        migrations.AddField(
+            model_name='contributor',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='contributor',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.gituser'),
+        ),
+        migrations.AddField(
+            model_name='commit',
+            name='branch',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='GitJS.branch'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.gituser'),
+        ),
+        migrations.AddField(
+            model_name='branch',
+            name='parent',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='children', to='GitJS.branch'),
+        ),
+        migrations.AddField(
+            model_name='branch',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='GitJS.project'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='watchedproject',
+            unique_together={('user', 'project')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='starredproject',
+            unique_together={('user', 'project')},
+        ),
+        migrations.AddIndex(
+            model_name='projectupdate',
+            index=models.Index(fields=['user', '-up_date', '-id'], name='GitJS_proje_user_id_6a971c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectevent',
+            index=models.Index(fields=['project', '-up_date', '-id'], name='GitJS_proje_project_bf83f6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milestone',
+            index=models.Index(fields=['project', 'state', 'due_date', 'id'], name='GitJS_miles_project_e719a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['branch', 'title', 'replaced_by'], name='GitJS_file_branch__799f51_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='contributor',
+            unique_together={('project', 'user')},
+        ),
+        migrations.AddIndex(
+            model_name='commit',
+            index=models.Index(fields=['branch', '-date_time', '-id'], name='GitJS_commi_branch__fcff7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['project', '-last_update', '-id'], name='GitJS_comme_project_f2ac78_idx'),
+        ),
+    ]
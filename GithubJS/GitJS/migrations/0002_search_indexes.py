@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# full text and trigram indexes used by search.py on postgres, the sqlite test database searches in python
+# instead; (model, index name prefix, title field matched by substring, fields matched by word)
+SEARCH_INDEXES = [
+    ('Project', 'project', 'title', []),
+    ('Branch', 'branch', 'name', []),
+    ('Milestone', 'milestone', 'title', ['description']),
+    ('Blob', 'blob', None, ['text']),
+    ('File', 'file', 'title', []),
+    ('Comment', 'comment', None, ['text']),
+    ('Issue', 'issue', 'title', ['description']),
+    ('PullRequest', 'pull_request', 'title', ['description']),
+]
+
+
+def _indexes(apps):
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models.functions import Upper
+    for model_name, name, title_field, text_fields in SEARCH_INDEXES:
+        model = apps.get_model('GitJS', model_name)
+        fields = [field for field in [title_field, *text_fields] if field]
+        yield model, GinIndex(SearchVector(*fields, config='simple'), name=name + '_search_idx')
+        if title_field:
+            yield model, GinIndex(OpClass(Upper(title_field), name='gin_trgm_ops'), name=name + '_trgm_idx')
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for model, index in _indexes(apps):
+        schema_editor.add_index(model, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model, index in _indexes(apps):
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('GitJS', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -6,24 +6,38 @@ from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse
 
-from .models import Project, Milestone
+from .models import Project, Milestone, GitUser
+from .object_cache import get_cached_object_or_404
+from .paging import get_cursor, get_next
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def get_milestones(request, project_id, state):
-    project = get_object_or_404(Project, id=project_id)
-    can_edit = project.can_edit(request.user.username)
+    project = get_cached_object_or_404(Project, project_id)
+    can_edit = project.can_edit(request.user)
+    milestones = list(project.get_milestone_page(state, get_cursor(request, 'after')))
+    next_milestones = get_next(milestones, milestones[-1].id if milestones else None)
     return render(request, 'milestones.html', {'title': 'Milestones for ' + project.title, 'project_id': project_id,
-                                               'milestones': project.get_milestones(state),
-                                               'can_edit': can_edit})
+                                               'milestones': milestones, 'state': state, 'can_edit': can_edit,
+                                               'next_milestones': next_milestones})
+
+
+@login_required(login_url='login/')
+@permission_required('GitJS.can_view', raise_exception=True)
+def upcoming_milestones(request):
+    user = get_object_or_404(GitUser, id=request.user.pk)
+    milestones = list(user.get_upcoming_milestones(get_cursor(request, 'after')))
+    next_milestones = get_next(milestones, milestones[-1].id if milestones else None)
+    return render(request, 'upcoming_milestones.html', {'title': 'Upcoming milestones', 'milestones': milestones,
+                                                        'next_milestones': next_milestones})
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def add_milestone(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    can_edit = project.can_edit(request.user.username)
+    project = get_cached_object_or_404(Project, project_id)
+    can_edit = project.can_edit(request.user)
     if request.method == 'GET':
         return render(request, 'milestone_form.html', {'title': 'New milestone', 'project_id': project_id,
                                                        'form_action': str(project_id)+'/add_milestone',
@@ -63,22 +77,19 @@ def add_milestone(request, project_id):
                                                            'can_edit': can_edit
                                                            })
         except:
-            new_id = len(Milestone.objects.all())
-            milestone = Milestone(id=new_id, title=new_title, description=new_desc, due_date=due_date, state='OPEN')
+            milestone = Milestone(title=new_title, description=new_desc, due_date=due_date, state='OPEN')
             milestone.project = project
             milestone.project.update_users('Milestone ' + milestone.title + ' added')
             milestone.save()
-            return render(request, 'milestones.html',
-                          {'title': 'Milestones for ' + project.title, 'project_id': project_id,
-                           'milestones': project.get_milestones('OPEN')})
+            return HttpResponseRedirect(reverse('milestones', args=(project.id, 'OPEN')))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def edit_milestone(request, milestone_id):
-    milestone = get_object_or_404(Milestone, id=milestone_id)
+    milestone = get_cached_object_or_404(Milestone, milestone_id)
     date_val = milestone.due_date.isoformat().split("T")[0]
-    can_edit = milestone.project.can_edit(request.user.username)
+    can_edit = milestone.project.can_edit(request.user)
     if request.method == 'GET':
         return render(request, 'milestone_form.html', {'title': 'Milestone #'+str(milestone_id),
                                                        'project_id': milestone.project.id,
@@ -133,21 +144,20 @@ def edit_milestone(request, milestone_id):
         milestone.title = new_title
         milestone.description = new_desc
         milestone.due_date = due_date
-        milestone.save()
-        return render(request, 'milestones.html',
-                      {'title': 'Milestones for ' + milestone.project.title, 'project_id': milestone.project.id,
-                       'milestones': milestone.project.get_milestones('OPEN')})
+        # the row may come from the cache, only the changed fields are written over the issue counters
+        milestone.save(update_fields=['title', 'description', 'due_date'])
+        return HttpResponseRedirect(reverse('milestones', args=(milestone.project.id, 'OPEN')))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def toggle_milestone_status(request, milestone_id):
-    milestone = get_object_or_404(Milestone, id=milestone_id)
+    milestone = get_cached_object_or_404(Milestone, milestone_id)
     if milestone.state == 'OPEN':
         milestone.state = 'CLOSED'
         milestone.project.update_users('Milestone ' + milestone.title + ' closed in ' + milestone.project.title)
     else:
         milestone.state = 'OPEN'
         milestone.project.update_users('Milestone ' + milestone.title + ' opened in ' + milestone.project.title)
-    milestone.save()
+    milestone.save(update_fields=['state'])
     return HttpResponseRedirect(reverse("milestones", args=(milestone.project.id, 'OPEN',)))
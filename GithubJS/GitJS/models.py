@@ -1,40 +1,148 @@
-from django.db import models
+import codecs
+import difflib
+import hashlib
+import json
+import re
+import zlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, Exists, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Substr
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .object_cache import bump_generation, uncache_objects
+
+CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+BULK_BATCH_SIZE = 1000
+FEED_PAGE_SIZE = 20
+CANDIDATE_LIMIT = 10
+BLOB_COMPRESS_SIZE = 64 * 1024
+BLOB_CHUNK_SIZE = 64 * 1024
+
+
+def _past_pivot(queryset, date_field, last_id, lookup):
+    # rows past the last one shown; an id that isn't a row of the feed, like one deleted since, starts it over
+    pivot_row = queryset.filter(id=last_id)
+    pivot = Subquery(pivot_row.values(date_field)[:1])
+    return queryset.filter(Q(**{date_field + '__' + lookup: pivot}) |
+                           Q(**{date_field: pivot, 'id__' + lookup: last_id}) | ~Exists(pivot_row))
+
+
+def _older_than(queryset, date_field, before):
+    # keyset pagination for feeds ordered by (date_field, id) descending, before is the id of the last row shown
+    if before is None:
+        return queryset
+    return _past_pivot(queryset, date_field, before, 'lt')
+
+
+def _later_than(queryset, date_field, after):
+    # the same for feeds ordered by (date_field, id) ascending, after is the id of the last row shown
+    if after is None:
+        return queryset
+    return _past_pivot(queryset, date_field, after, 'gt')
+
+
+def _milestone_page(milestones, after):
+    # the progress of every milestone is read from its stored issue counters, see Milestone.get_percent
+    return _later_than(milestones.order_by('due_date', 'id'), 'due_date', after)[:FEED_PAGE_SIZE]
+
+
+def _add_to_counters(model, pk, **steps):
+    # counted by the database, so concurrent writers all count
+    model.objects.filter(pk=pk).update(**{field: F(field) + step for field, step in steps.items()})
+    uncache_objects(model, [pk])
+
+
+class _CountedInProject(models.Model):
+    # rows counted in the project_counter field of their project, see recount for the other counters
+    project_counter = None
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding:
+                _add_to_counters(Project, self.project_id, **{self.project_counter: 1})
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            deleted = super().delete(*args, **kwargs)
+            # a row already deleted by another request isn't counted twice
+            if deleted[0]:
+                _add_to_counters(Project, self.project_id, **{self.project_counter: -1})
+        return deleted
+
 
 class GitUser(User):
 
-    def get_my_projects(self):
-        all_projects = Project.objects.all()
-        my_projects = []
-        for project in all_projects:
-            if project.can_edit(self.username):
-                my_projects.append(project)
-        return my_projects
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            _detach_copies(Branch.objects.filter(project__lead=self))
+            # the user's stars and watches go with the cascade, which doesn't call their delete
+            counted = list(Project.objects.filter(Q(starredproject__user_id=self.pk) |
+                                                  Q(watchedproject__user_id=self.pk))
+                           .exclude(lead_id=self.pk).values_list('id', flat=True).distinct())
+            # so do the contributor rows, and with them what can_edit cached for the user
+            editable = list(Project.objects.filter(Q(lead_id=self.pk) | Q(contributor__user_id=self.pk))
+                            .values_list('id', flat=True).distinct())
+            user_id = self.pk
+            deleted = super().delete(*args, **kwargs)
+            recount(Project.objects.filter(id__in=counted))
+            uncache_objects(Project, counted)
+            cache.delete_many([_can_edit_key(project_id, user_id) for project_id in editable])
+        return deleted
+
+    def get_my_projects(self, after=None):
+        contributor = Contributor.objects.filter(project_id=OuterRef('id'), user_id=self.pk)
+        my_projects = Project.objects.filter(Q(lead_id=self.pk) | Exists(contributor)).select_related('lead')
+        if after is not None:
+            my_projects = my_projects.filter(id__gt=after)
+        return my_projects.order_by('id')[:FEED_PAGE_SIZE]
+
+    def get_upcoming_milestones(self, after=None):
+        # open milestones of the projects the user leads or contributes to, the ones due first on top
+        contributor = Contributor.objects.filter(project_id=OuterRef('project_id'), user_id=self.pk)
+        milestones = Milestone.objects.filter(Q(project__lead_id=self.pk) | Exists(contributor), state='OPEN',
+                                              due_date__gte=timezone.now()).select_related('project')
+        return _milestone_page(milestones, after)
 
     def get_starred_projects(self):
-        starred_projects = StarredProject.objects.filter(user_id=self.pk)
+        starred_projects = StarredProject.objects.filter(user_id=self.pk).select_related('project__lead') \
+            .order_by('id')
         starred = []
         for sp in starred_projects:
-            starred.append(Project.objects.get(id=sp.project_id))
+            starred.append(sp.project)
         return starred
 
     def add_starred(self, project_id):
-        new_starred = StarredProject(project_id=project_id, user_id=self.pk)
-        new_starred.save()
+        StarredProject.objects.get_or_create(project_id=project_id, user_id=self.pk)
 
     def remove_starred(self, project_id):
         starred = StarredProject.objects.get(project_id=project_id, user_id=self.pk)
         starred.delete()
 
-    def get_watched_changes(self):
-        watched_projects = ProjectUpdate.objects.filter(user_id=self.pk).order_by('-up_date')
-        return watched_projects
+    def get_watched_changes(self, before=None):
+        if settings.WATCHED_CHANGES_MODE == 'read':
+            # events of all watched projects merged at read time, starting from the moment each one was watched
+            watched = WatchedProject.objects.filter(user_id=self.pk, project_id=OuterRef('project_id'),
+                                                    last_event_id__lt=OuterRef('id'))
+            watched_projects = ProjectEvent.objects.filter(Exists(watched)).order_by('-up_date', '-id')
+        else:
+            watched_projects = ProjectUpdate.objects.filter(user_id=self.pk).order_by('-up_date', '-id')
+        return _older_than(watched_projects, 'up_date', before)[:FEED_PAGE_SIZE]
 
     def add_watched(self, project_id):
-        new_watched = WatchedProject(project_id=project_id, user_id=self.pk)
-        new_watched.save()
+        last_event_id = ProjectEvent.objects.aggregate(Max('id'))['id__max'] or 0
+        WatchedProject.objects.get_or_create(project_id=project_id, user_id=self.pk,
+                                             defaults={'last_event_id': last_event_id})
 
     def remove_watched(self, project_id):
         watched = WatchedProject.objects.get(project_id=project_id, user_id=self.pk)
@@ -45,51 +153,61 @@ class Project(models.Model):
     title = models.CharField(max_length=100)
     forked_from = models.ForeignKey('self', null=True, on_delete=models.SET_NULL)
     lead = models.ForeignKey(GitUser, on_delete=models.CASCADE)
+    # kept by the write paths of the counted rows, the recount command repairs them
+    branch_count = models.IntegerField(default=0)
+    open_issue_count = models.IntegerField(default=0)
+    closed_issue_count = models.IntegerField(default=0)
+    open_pull_request_count = models.IntegerField(default=0)
+    star_count = models.IntegerField(default=0)
+    watcher_count = models.IntegerField(default=0)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            _detach_copies(Branch.objects.filter(project=self))
+            return super().delete(*args, **kwargs)
 
     def get_branch_number(self):
-        branches = Branch.objects.filter(project=self)
-        return len(branches)
+        return self.branch_count
 
     def get_branches(self):
         branches = Branch.objects.filter(project=self)
         return branches
 
     def update_users(self, message):
-        for watched in WatchedProject.objects.filter(project_id=self.id):
-            new_date = timezone.now()
-            update = ProjectUpdate(project_id=self.id, user_id=watched.user_id, up_date=new_date, message=message)
+        if settings.WATCHED_CHANGES_MODE == 'read':
+            event = ProjectEvent(project_id=self.id, up_date=timezone.now(), message=message)
+            event.save()
+        else:
+            # watchers get the update when the queue is delivered, see deliver_queued_updates
+            update = QueuedUpdate(project_id=self.id, up_date=timezone.now(), message=message)
             update.save()
 
     def get_milestones(self, state):
         milestones = Milestone.objects.filter(project=self, state=state)
         return milestones
 
+    def get_milestone_page(self, state, after=None):
+        return _milestone_page(Milestone.objects.filter(project=self, state=state), after)
+
     def get_issues(self, state):
         issues = Issue.objects.filter(project=self, state=state)
         return issues
 
     def get_pull_requests(self, state):
-        pull_requests = []
-        if state == 'OPEN':
-            pull_requests = PullRequest.objects.filter(project=self, state=state)
-        else:
-            all_requests = PullRequest.objects.filter(project=self)
-            for req in all_requests:
-                if req.state == 'CLOSED' or req.state == 'MERGED':
-                    pull_requests.append(req)
+        states = [state] if state == 'OPEN' else ['CLOSED', 'MERGED']
+        pull_requests = PullRequest.objects.filter(project=self, state__in=states) \
+            .select_related('source', 'target', 'issue').order_by('id')
         return pull_requests
 
     def get_contributors(self):
-        contributors = Contributor.objects.filter(project_id=self.id)
+        contributors = Contributor.objects.filter(project_id=self.id).select_related('user').order_by('id')
         return contributors
 
-    def get_noncontributors(self):
-        ret = []
-        for con in GitUser.objects.all():
-            if self.lead.username != con.username and \
-             len(Contributor.objects.filter(username=con.username, project_id=self.id)) == 0:
-                ret.append(con.username)
-        return ret
+    def get_noncontributors(self, prefix='', limit=None):
+        contributor = Contributor.objects.filter(project_id=self.id, user_id=OuterRef('pk'))
+        users = GitUser.objects.exclude(pk=self.lead_id).filter(~Exists(contributor), username__startswith=prefix) \
+            .order_by('username').values_list('username', flat=True)
+        return list(users[:limit])
 
     def get_all_participants(self):
         participants = []
@@ -98,88 +216,475 @@ class Project(models.Model):
         participants.append(self.lead.username)
         return participants
 
-    def can_edit(self, username):
-        for participant in self.get_all_participants():
-            if participant == username:
-                return True
-        return False
-
-    def get_comments(self, username):
-        comments = Comment.objects.filter(project=self).order_by('-last_update')
+    def can_edit(self, user):
+        # memoised on the instance for the current request and cached until the contributors change,
+        # by user id since a username can be taken again after a rename or delete
+        if user.pk is None:
+            return False
+        if not hasattr(self, '_can_edit'):
+            self._can_edit = {}
+        if user.pk not in self._can_edit:
+            key = _can_edit_key(self.id, user.pk)
+            allowed = cache.get(key)
+            if allowed is None:
+                contributor = Contributor.objects.filter(project_id=OuterRef('id'), user_id=user.pk)
+                allowed = Project.objects.filter(Q(lead_id=user.pk) | Exists(contributor), id=self.id).exists()
+                cache.set(key, allowed, CACHE_TTL)
+            self._can_edit[user.pk] = allowed
+        return self._can_edit[user.pk]
+
+    def add_contributor(self, user):
+        Contributor.objects.get_or_create(user_id=user.pk, project_id=self.id)
+        cache.delete(_can_edit_key(self.id, user.pk))
+
+    def remove_contributor(self, user):
+        Contributor.objects.get(user_id=user.pk, project_id=self.id).delete()
+
+    def fork(self, user):
+        with transaction.atomic():
+            taken = set(Project.objects.filter(lead=user, title__startswith=self.title)
+                        .values_list('title', flat=True))
+            new_title = self.title
+            while new_title in taken:
+                new_title += '_'
+            new_project = Project(title=new_title, lead=user, forked_from=self)
+            new_project.save()
+
+            for branch in Branch.objects.filter(project=self).order_by('id'):
+                branch.copy(branch.name, new_project, branch.default)
+        return new_project
+
+    def get_comments(self, username, before=None):
+        reactions = Reaction.objects.filter(comment=OuterRef('pk'), user__username=username)
+        comments = Comment.objects.filter(project=self).select_related('user') \
+            .annotate(viewer_reaction=Subquery(reactions.values('type')[:1])).order_by('-last_update', '-id')
         ret = []
-        for comment in comments:
-            user = GitUser.objects.get_by_natural_key(username)
-            reaction = Reaction.objects.filter(comment=comment, user=user)
-            if len(reaction) == 0:
-                ret.append({"comment": comment, "reaction": ""})
-            else:
-                ret.append({"comment": comment, "reaction": reaction[0].type})
+        for comment in _older_than(comments, 'last_update', before)[:FEED_PAGE_SIZE]:
+            ret.append({"comment": comment, "reaction": comment.viewer_reaction or ""})
         return ret
 
 
-class StarredProject(models.Model):
-    project_id = models.BigIntegerField()
-    user_id = models.BigIntegerField()
+def _can_edit_key(project_id, user_id):
+    return 'can_edit:%d:%d' % (project_id, user_id)
 
 
-class WatchedProject(models.Model):
-    project_id = models.BigIntegerField()
-    user_id = models.BigIntegerField()
+class StarredProject(_CountedInProject):
+    project_counter = 'star_count'
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    user = models.ForeignKey(GitUser, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ['user', 'project']
+
+
+class WatchedProject(_CountedInProject):
+    project_counter = 'watcher_count'
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    user = models.ForeignKey(GitUser, on_delete=models.CASCADE)
+    # newest project event when watching started, older events are left out of the user's changes
+    last_event_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'project']
 
 
 class Contributor(models.Model):
-    project_id = models.BigIntegerField()
-    username = models.CharField(max_length=100)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    user = models.ForeignKey(GitUser, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ['project', 'user']
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        cache.delete(_can_edit_key(self.project_id, self.user_id))
+        return deleted
+
+    @property
+    def username(self):
+        return self.user.username
 
 
 class ProjectUpdate(models.Model):
     up_date = models.DateTimeField("date updated")
     message = models.CharField(max_length=100)
-    project_id = models.BigIntegerField()
-    user_id = models.BigIntegerField()
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    user = models.ForeignKey(GitUser, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-up_date', '-id'])]
 
 
-class Branch(models.Model):
+class ProjectEvent(models.Model):
+    up_date = models.DateTimeField("date updated")
+    message = models.CharField(max_length=100)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['project', '-up_date', '-id'])]
+
+
+class QueuedUpdate(models.Model):
+    up_date = models.DateTimeField("date updated")
+    message = models.CharField(max_length=100)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+
+    def deliver(self):
+        watchers = WatchedProject.objects.filter(project_id=self.project_id).values_list('user_id', flat=True)
+        ProjectUpdate.objects.bulk_create([ProjectUpdate(project_id=self.project_id, user_id=user_id,
+                                                         up_date=self.up_date, message=self.message)
+                                           for user_id in watchers.iterator()], batch_size=BULK_BATCH_SIZE)
+
+
+def deliver_queued_updates(limit=100):
+    with transaction.atomic():
+        queued = QueuedUpdate.objects.order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # several workers can drain the queue without delivering an update twice
+            queued = queued.select_for_update(skip_locked=True)
+        queued = list(queued[:limit])
+        for update in queued:
+            update.deliver()
+        QueuedUpdate.objects.filter(id__in=[update.id for update in queued]).delete()
+    return len(queued)
+
+
+def _detach_copies(branches):
+    # copies still read files and commits of the deleted branches, so the ones that aren't deleted with them
+    # get their own rows first
+    for copy in Branch.objects.filter(parent__in=branches).exclude(id__in=branches.values('id')):
+        copy.detach()
+
+
+class Branch(_CountedInProject):
+    project_counter = 'branch_count'
     name = models.CharField(max_length=100)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     default = models.BooleanField()
+    # copies share the files and commits of their parent as they were when the copy was made,
+    # base ids mark the newest parent rows the copy can see
+    parent = models.ForeignKey('self', null=True, on_delete=models.RESTRICT, related_name='children')
+    base_file_id = models.BigIntegerField(null=True)
+    base_commit_id = models.BigIntegerField(null=True)
+    # commits shown for the branch, those a copy shares with its parent included, kept by Commit.save
+    commit_count = models.IntegerField(default=0)
+
+    def get_layers(self):
+        layers = [(self, None, None)]
+        child = self
+        while child.parent is not None:
+            layers.append((child.parent, child.base_file_id, child.base_commit_id))
+            child = child.parent
+        return layers
 
     def get_commits(self):
-        commits = Commit.objects.filter(branch=self).order_by('-date_time')
-        return commits
+        if self.parent_id is None:
+            return Commit.objects.filter(branch=self).order_by('-date_time', '-id')
+        visible = Q()
+        for branch, _, base_commit_id in self.get_layers():
+            if base_commit_id is None:
+                visible |= Q(branch=branch)
+            else:
+                visible |= Q(branch=branch, id__lte=base_commit_id)
+        return Commit.objects.filter(visible).order_by('-date_time', '-id')
+
+    def get_commit_page(self, before=None):
+        return _older_than(self.get_commits(), 'date_time', before)[:FEED_PAGE_SIZE]
 
     def get_files(self):
-        files = File.objects.filter(branch=self)
-        return files
+        if self.parent_id is None:
+            return File.objects.filter(branch=self, deleted=False, replaced_by__isnull=True)
+        layers = self.get_layers()
+        visible = Q()
+        for branch, base_file_id, _ in layers:
+            visible |= _file_layer(branch, base_file_id)
+        # a title present in a closer layer (even as a deletion) hides the rows of the farther ones
+        depth = Case(*[When(branch_id=branch.id, then=Value(i)) for i, (branch, _, _) in enumerate(layers)])
+        closer = File.objects.filter(visible, title=OuterRef('title')).alias(depth=depth) \
+            .filter(depth__lt=OuterRef('depth'))
+        return File.objects.filter(visible).alias(depth=depth).filter(~Exists(closer), deleted=False).order_by('id')
+
+    def get_snapshot(self):
+        # hash of the titles and contents of the branch's files, it changes whenever the files do
+        digest = hashlib.sha256()
+        for title, blob_id in self.get_files().values_list('title', 'blob_id').iterator(chunk_size=BULK_BATCH_SIZE):
+            digest.update(json.dumps([title, blob_id]).encode())
+        return digest.hexdigest()
 
     def get_file_by_title(self, title):
-        found = File.objects.filter(branch=self, title=title)
+        found = self.get_files().filter(title=title)
         if len(found) == 0:
             return None
         return found[0]
 
+    def lock(self):
+        # taken by everything that writes the branch's files or commits and by copies of it, so the base ids
+        # of a copy are the branch's newest rows and nothing written after them can be older
+        Branch.objects.select_for_update().filter(id=self.id).values_list('id').get()
+
+    def copy(self, name, project, default=False):
+        with transaction.atomic():
+            self.lock()
+            new_branch = Branch(name=name, project=project, default=default, parent=self,
+                                base_file_id=File.objects.filter(branch=self).aggregate(Max('id'))['id__max'] or 0,
+                                base_commit_id=Commit.objects.filter(branch=self).aggregate(Max('id'))['id__max'] or 0,
+                                commit_count=self.get_commits().count())
+            new_branch.save()
+        return new_branch
+
+    def detach(self):
+        # turns a copy into a standalone branch, used before the branch it was copied from is deleted
+        with transaction.atomic():
+            for child in self.children.all():
+                child.detach()
+            if self.parent_id is None:
+                return
+            self.lock()
+            last_file_id = File.objects.filter(branch=self).aggregate(Max('id'))['id__max'] or 0
+            File.objects.bulk_create([File(title=file.title, blob_id=file.blob_id, branch=self)
+                                      for file in self.get_files().exclude(branch=self).iterator()],
+                                     batch_size=BULK_BATCH_SIZE)
+            Commit.objects.bulk_create([Commit(log_message=commit.log_message, date_time=commit.date_time,
+                                               committer=commit.committer, branch=self)
+                                        for commit in self.get_commits().exclude(branch=self).iterator()],
+                                       batch_size=BULK_BATCH_SIZE)
+            File.objects.filter(Q(deleted=True) | Q(replaced_by__isnull=False), branch=self).delete()
+            if settings.SEARCH_INDEX:
+                # bulk created rows don't send post_save
+                add_search_postings('files', search_index_rows('files', File.objects.filter(branch=self,
+                                                                                           id__gt=last_file_id)))
+            self.parent = None
+            self.base_file_id = None
+            self.base_commit_id = None
+            self.save(update_fields=['parent', 'base_file_id', 'base_commit_id'])
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            _detach_copies(Branch.objects.filter(id=self.id))
+            return super().delete(*args, **kwargs)
+
+    def is_shared(self, file):
+        return Branch.objects.filter(parent_id=file.branch_id, base_file_id__gte=file.id).exists()
+
+    def _put_file(self, title, blob, deleted=False):
+        new_file = File(title=title, branch=self, deleted=deleted)
+        new_file.set_blob(blob)
+        new_file.save()
+        current = File.objects.filter(branch=self, title=title, replaced_by__isnull=True).exclude(id=new_file.id)
+        for old in current:
+            if self.is_shared(old):
+                old.replaced_by = new_file.id
+                old.save()
+            else:
+                old.delete()
+        return new_file
+
+    def add_file(self, title, text):
+        with transaction.atomic():
+            self.lock()
+            return self._put_file(title, Blob.for_text(text))
+
+    def change_file(self, file, title, text):
+        return self._change_file(file, title, Blob.for_text(text))
+
+    def _change_file(self, file, title, blob):
+        with transaction.atomic():
+            self.lock()
+            if file.branch_id == self.id and not self.is_shared(file):
+                old_title = file.title
+                file.title = title
+                file.set_blob(blob)
+                file.save()
+                if old_title != title and self.parent_id is not None:
+                    self._put_file(old_title, Blob.for_text(''), deleted=True)
+                return file
+            if file.title != title:
+                self.remove_file(file)
+            return self._put_file(title, blob)
+
+    def upload_file(self, title, blob):
+        # adds the file, or changes its contents when the branch already has a file with this title
+        with transaction.atomic():
+            self.lock()
+            current = self.get_file_by_title(title)
+            if current is None:
+                return self._put_file(title, blob)
+            return self._change_file(current, title, blob)
+
+    def remove_file(self, file):
+        with transaction.atomic():
+            self.lock()
+            if file.branch_id == self.id and self.parent_id is None and not self.is_shared(file):
+                file.delete()
+            else:
+                self._put_file(file.title, Blob.for_text(''), deleted=True)
+
 
 class Milestone(models.Model):
     title = models.CharField(max_length=100)
     description = models.CharField(max_length=200)
     due_date = models.DateTimeField("due date")
     state = models.CharField(max_length=7)
-    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, db_index=False)
+    # kept by Issue.save like the issue counters of the project
+    open_issue_count = models.IntegerField(default=0)
+    closed_issue_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['project', 'state', 'due_date', 'id'])]
 
     def get_issues(self, state):
         issues = Issue.objects.filter(milestone=self, state=state)
         return issues
 
     def get_percent(self):
-        completed = len(Issue.objects.filter(milestone=self, state='CLOSED'))
-        total = len(Issue.objects.filter(milestone=self))
+        completed = self.closed_issue_count
+        total = self.open_issue_count + self.closed_issue_count
         return int(round((completed * 100) / total, 2)) if total != 0 else 0
 
 
+class Blob(models.Model):
+    # file contents stored once for every file with the same text, under the text's sha256
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    # large contents are kept zlib compressed in data, with text left empty
+    text = models.TextField(blank=True)
+    data = models.BinaryField(null=True)
+
+    @staticmethod
+    def for_text(text):
+        encoded = text.encode()
+        blob = Blob(sha256=hashlib.sha256(encoded).hexdigest(), size=len(encoded))
+        if len(encoded) > BLOB_COMPRESS_SIZE:
+            blob.data = zlib.compress(encoded)
+        else:
+            blob.text = text
+        return blob
+
+    @staticmethod
+    def from_chunks(chunks):
+        # blob of uploaded bytes read a chunk at a time, only the compressed contents of a large file are kept whole
+        sha256 = hashlib.sha256()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        compressor = zlib.compressobj()
+        compressed = []
+        head = []
+        size = 0
+        for chunk in chunks:
+            sha256.update(chunk)
+            # raises UnicodeDecodeError for anything that isn't text
+            decoder.decode(chunk)
+            compressed.append(compressor.compress(chunk))
+            size += len(chunk)
+            if size <= BLOB_COMPRESS_SIZE:
+                head.append(chunk)
+        decoder.decode(b'', final=True)
+        blob = Blob(sha256=sha256.hexdigest(), size=size)
+        if size > BLOB_COMPRESS_SIZE:
+            compressed.append(compressor.flush())
+            blob.data = b''.join(compressed)
+        else:
+            blob.text = b''.join(head).decode()
+        return blob
+
+    def read(self):
+        if self.size <= BLOB_COMPRESS_SIZE:
+            return self.text
+        return b''.join(self.chunks()).decode()
+
+    def chunks(self, size=BLOB_CHUNK_SIZE):
+        # the contents as bytes, decompressed a piece at a time
+        if self.size <= BLOB_COMPRESS_SIZE:
+            encoded = self.text.encode()
+            for start in range(0, len(encoded), size):
+                yield encoded[start:start + size]
+            return
+        decompressor = zlib.decompressobj()
+        for piece in self._data_pieces(size):
+            yield decompressor.decompress(piece)
+        yield decompressor.flush()
+
+    def _data_pieces(self, size):
+        if 'data' not in self.get_deferred_fields():
+            data = memoryview(self.data)
+            for start in range(0, len(data), size):
+                yield data[start:start + size]
+            return
+        # blobs loaded without their data read it a slice per query, a large file is never held whole
+        start = 0
+        while True:
+            piece = Blob.objects.filter(sha256=self.sha256) \
+                .values_list(Substr('data', start + 1, size, output_field=models.BinaryField()), flat=True).get()
+            if piece:
+                yield piece
+            if piece is None or len(piece) < size:
+                return
+            start += size
+
+    def byte_range(self, start, end):
+        # bytes from start to end inclusive, as chunks
+        offset = 0
+        for chunk in self.chunks():
+            if offset + len(chunk) > start:
+                yield chunk[max(start - offset, 0):end + 1 - offset]
+            offset += len(chunk)
+            if offset > end:
+                break
+
+
+def store_blobs(files):
+    # saves the blobs of texts given to the files, identical texts are stored once
+    blobs = {}
+    for file in files:
+        if file.new_blob is not None:
+            blobs[file.new_blob.sha256] = file.new_blob
+            file.new_blob = None
+    Blob.objects.bulk_create(blobs.values(), batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+
+
 class File(models.Model):
     title = models.CharField(max_length=100)
-    text = models.CharField(max_length=200)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT)
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE)
+    # rows kept only for copies of the branch: deletion markers and rows replaced after the copy was made
+    deleted = models.BooleanField(default=False)
+    # id of a row newer than the base ids of the copies that still see this one, compared with them only;
+    # not a foreign key, the replacing row is deleted when it is replaced in turn and this one must stay hidden
+    replaced_by = models.BigIntegerField(null=True)
+
+    new_blob = None
+    # files are cached with their branch, see object_cache
+    cached_with = 'branch'
+
+    class Meta:
+        # current rows of a title and the layers of copies are looked up by these
+        indexes = [models.Index(fields=['branch', 'title', 'replaced_by'])]
+
+    def _set_text(self, text):
+        self.set_blob(Blob.for_text(text))
+
+    # write only, the contents are read with blob.read() so the query for the blob stays visible
+    text = property(fset=_set_text)
+
+    def set_blob(self, blob):
+        self.blob = self.new_blob = blob
+
+    def save(self, *args, **kwargs):
+        store_blobs([self])
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        # a post_delete receiver would keep branches from deleting their files in one query
+        uncache_objects(Branch, [self.branch_id])
+        bump_generation(Branch, self.branch_id)
+        return super().delete(*args, **kwargs)
+
+
+def _file_layer(branch, base_file_id):
+    if base_file_id is None:
+        return Q(branch=branch, replaced_by__isnull=True)
+    return Q(branch=branch, id__lte=base_file_id) & \
+        (Q(replaced_by__isnull=True) | Q(replaced_by__gt=base_file_id))
 
 
 class Comment(models.Model):
@@ -188,6 +693,9 @@ class Comment(models.Model):
     user = models.ForeignKey(GitUser, on_delete=models.CASCADE)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [models.Index(fields=['project', '-last_update', '-id'])]
+
 
 class Reaction(models.Model):
     type = models.CharField(max_length=10)
@@ -203,13 +711,46 @@ class Issue(models.Model):
     milestone = models.ForeignKey(Milestone, null=True, on_delete=models.SET_NULL)
     assignee = models.ForeignKey(GitUser, null=True, on_delete=models.SET_NULL)
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            counted = None
+            if not self._state.adding:
+                # the instance may come from the cache, what was counted is read from the locked row
+                counted = Issue.objects.select_for_update().filter(pk=self.pk) \
+                    .values_list('project_id', 'milestone_id', 'state').first()
+            super().save(*args, **kwargs)
+            steps = {}
+            for issue, step in [(counted, -1), ((self.project_id, self.milestone_id, self.state), 1)]:
+                if issue is None:
+                    continue
+                project_id, milestone_id, state = issue
+                field = 'open_issue_count' if state == 'OPEN' else 'closed_issue_count'
+                for row in [(Project, project_id), (Milestone, milestone_id)]:
+                    if row[1] is not None:
+                        steps.setdefault(row, Counter())[field] += step
+            # one update for every project or milestone the issue moved within, into or out of
+            for (model, pk), fields in steps.items():
+                fields = {field: step for field, step in fields.items() if step}
+                if fields:
+                    _add_to_counters(model, pk, **fields)
+
 
 class Commit(models.Model):
     log_message = models.CharField(max_length=200)
     date_time = models.DateTimeField("date committed")
-    branch = models.ForeignKey(Branch, on_delete=models.CASCADE)
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, db_index=False)
     committer = models.CharField(max_length=100)
 
+    class Meta:
+        indexes = [models.Index(fields=['branch', '-date_time', '-id'])]
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            if self._state.adding:
+                # counted first, the update locks the branch before the commit gets its id, see Branch.lock
+                _add_to_counters(Branch, self.branch_id, commit_count=1)
+            super().save(*args, **kwargs)
+
 
 class PullRequest(models.Model):
     state = models.CharField(max_length=7)
@@ -220,28 +761,205 @@ class PullRequest(models.Model):
     source = models.ForeignKey(Branch, null=True, on_delete=models.SET_NULL, related_name='source')
     target = models.ForeignKey(Branch, null=True, on_delete=models.SET_NULL, related_name='target')
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            counted = None
+            if not self._state.adding:
+                # read like in Issue.save
+                counted = PullRequest.objects.select_for_update().filter(pk=self.pk) \
+                    .values_list('project_id', 'state').first()
+            super().save(*args, **kwargs)
+            counting = (self.project_id, self.state)
+            if counting != counted:
+                if counted is not None and counted[1] == 'OPEN':
+                    _add_to_counters(Project, counted[0], open_pull_request_count=-1)
+                if self.state == 'OPEN':
+                    _add_to_counters(Project, self.project_id, open_pull_request_count=1)
+
+    def _get_branch_blobs(self):
+        source = [(file.title, file.blob_id) for file in self.source.get_files()]
+        target = {file.title: file.blob_id for file in self.target.get_files()}
+        return source, target
+
     def get_differences(self):
-        different_files = self.source.get_files()
-        differences = []
-        for different in different_files:
-            if self.target.get_file_by_title(different.title):
-                target_file = self.target.get_file_by_title(different.title)
-                differences.append([target_file.text, different.text])
-            else:
-                differences.append(['', different.text])
-        return differences
+        source, target = self._get_branch_blobs()
+        blobs = Blob.objects.in_bulk({blob_id for title, blob_id in source} | set(target.values()))
+        return [[blobs[target[title]].read() if title in target else '', blobs[blob_id].read()]
+                for title, blob_id in source]
+
+    def get_file_diffs(self):
+        # unified diffs of the source files against the target, cached for as long as neither branch changes
+        source, target = self._get_branch_blobs()
+        snapshot = json.dumps([source, sorted(target.items())])
+        key = 'file_diffs:' + hashlib.sha256(snapshot.encode()).hexdigest()
+        diffs = cache.get(key)
+        if diffs is None:
+            # identical contents have the same blob, only the changed ones are read
+            changed = [(target.get(title), blob_id) for title, blob_id in source if target.get(title) != blob_id]
+            blobs = Blob.objects.in_bulk({blob_id for pair in changed for blob_id in pair if blob_id is not None})
+            diffs = []
+            for title, blob_id in source:
+                if target.get(title) == blob_id:
+                    diffs.append({'title': title, 'state': 'unchanged', 'lines': []})
+                else:
+                    before = blobs[target[title]].read() if title in target else None
+                    diffs.append(_file_diff(title, before, blobs[blob_id].read()))
+            cache.set(key, diffs, CACHE_TTL)
+        return diffs
 
     def merge_branches(self):
-        source_files = self.source.get_files()
-        new_files = []
-        new_id = File.objects.all().order_by('-id')[0].id + 1
-        for file in source_files:
-            if self.target.get_file_by_title(file.title):
-                changed = File.objects.get(title=file.title, branch=self.target)
-                changed.text = file.text
-                changed.save()
-            else:
-                new_file = File(id=new_id, title=file.title, text=file.text, branch=self.target)
-                new_files.append(new_file)
-                new_id += 1
-        File.objects.bulk_create(new_files)
+        # one read per branch and bulk writes, with the same rules for shared rows as Branch.change_file
+        summary = {'added': 0, 'modified': 0, 'unchanged': 0}
+        with transaction.atomic():
+            target = self.target
+            target.lock()
+            current = {file.title: file for file in target.get_files()}
+            copies = Branch.objects.filter(parent_id=target.id)
+            shared_up_to = copies.aggregate(Max('base_file_id'))['base_file_id__max']
+            new_files = []
+            in_place = []
+            replaced = []
+            for file in self.source.get_files():
+                old = current.get(file.title)
+                if old is None:
+                    summary['added'] += 1
+                elif old.blob_id == file.blob_id:
+                    summary['unchanged'] += 1
+                    continue
+                else:
+                    summary['modified'] += 1
+                    if old.branch_id == target.id and (shared_up_to is None or old.id > shared_up_to):
+                        old.blob_id = file.blob_id
+                        in_place.append(old)
+                        continue
+                    if old.branch_id == target.id:
+                        replaced.append(old.id)
+                new_files.append(File(title=file.title, blob_id=file.blob_id, branch=target))
+
+            last_file_id = File.objects.filter(branch=target).aggregate(Max('id'))['id__max'] or 0
+            File.objects.bulk_update(in_place, ['blob'], batch_size=BULK_BATCH_SIZE)
+            File.objects.bulk_create(new_files, batch_size=BULK_BATCH_SIZE)
+            # deletion markers of added titles are retired like the replaced rows
+            retired = File.objects.filter(branch=target, replaced_by__isnull=True) \
+                .filter(Q(id__in=replaced) | Q(deleted=True, title__in=[file.title for file in new_files]))
+            if shared_up_to is not None:
+                # any id of the new rows works, it only has to be newer than what the copies can see
+                newest_file_id = File.objects.filter(branch=target).aggregate(Max('id'))['id__max']
+                retired.filter(id__lte=shared_up_to).update(replaced_by=newest_file_id)
+                retired = retired.filter(id__gt=shared_up_to)
+            retired.delete()
+            # bulk writes don't send post_save, the cached branch and the word index are updated here
+            uncache_objects(Branch, [target.id])
+            bump_generation(Branch, target.id)
+
+            if settings.SEARCH_INDEX:
+                SearchPosting.objects.filter(kind='files', object_id__in=[file.id for file in in_place]).delete()
+                written = File.objects.filter(Q(id__in=[file.id for file in in_place]) |
+                                              Q(branch=target, id__gt=last_file_id))
+                add_search_postings('files', search_index_rows('files', written))
+        return summary
+
+
+def _file_diff(title, before, after):
+    state = 'added' if before is None else 'changed'
+    lines = []
+    for line in difflib.unified_diff((before or '').splitlines(), after.splitlines(), 'a/' + title, 'b/' + title,
+                                     lineterm=''):
+        if line.startswith('@@'):
+            lines.append(('hunk', line))
+        elif line.startswith('+') and not line.startswith('+++'):
+            lines.append(('added', line))
+        elif line.startswith('-') and not line.startswith('---'):
+            lines.append(('removed', line))
+        elif not line.startswith(('+++', '---')):
+            lines.append(('context', line))
+    return {'title': title, 'state': state, 'lines': lines}
+
+
+def _count(model, field, **filters):
+    # rows of model pointing at the updated row through field
+    rows = model.objects.filter(**{field: OuterRef('pk')}, **filters).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(count=Count('pk')).values('count')), 0)
+
+
+def recount(queryset):
+    # sets the stored counters of the projects, milestones or branches of queryset from the counted rows
+    if queryset.model is Branch:
+        # commits of copies are counted through their layers, one copy at a time
+        updated = queryset.filter(parent__isnull=True).update(commit_count=_count(Commit, 'branch'))
+        for branch in queryset.filter(parent__isnull=False):
+            updated += Branch.objects.filter(id=branch.id).update(commit_count=branch.get_commits().count())
+        return updated
+    if queryset.model is Milestone:
+        return queryset.update(open_issue_count=_count(Issue, 'milestone', state='OPEN'),
+                               closed_issue_count=_count(Issue, 'milestone', state='CLOSED'))
+    return queryset.update(branch_count=_count(Branch, 'project'),
+                           open_issue_count=_count(Issue, 'project', state='OPEN'),
+                           closed_issue_count=_count(Issue, 'project', state='CLOSED'),
+                           open_pull_request_count=_count(PullRequest, 'project', state='OPEN'),
+                           star_count=_count(StarredProject, 'project'),
+                           watcher_count=_count(WatchedProject, 'project'))
+
+
+class SearchPosting(models.Model):
+    # one word of an indexed text, kept up to date by signals.py when SEARCH_INDEX is on
+    kind = models.CharField(max_length=20)
+    word = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    count = models.IntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['kind', 'word', 'object_id']), models.Index(fields=['kind', 'object_id'])]
+
+
+# fields in the search index, by the kind of search result they belong to
+SEARCH_INDEXED = {'files': (File, ['title', 'blob']), 'issues': (Issue, ['title', 'description']),
+                  'pull_requests': (PullRequest, ['title', 'description']), 'comments': (Comment, ['text'])}
+
+
+def search_words(text):
+    return [word[:100] for word in re.findall(r'\w+', text.lower())]
+
+
+def add_search_postings(kind, rows):
+    # rows are (object id, *indexed fields) tuples that have no postings yet, any number of them can be streamed in
+    batch = []
+    for object_id, *texts in rows:
+        counts = {}
+        for word in search_words(' '.join(texts)):
+            counts[word] = counts.get(word, 0) + 1
+        batch.extend(SearchPosting(kind=kind, word=word, object_id=object_id, count=count)
+                     for word, count in counts.items())
+        if len(batch) >= BULK_BATCH_SIZE:
+            SearchPosting.objects.bulk_create(batch)
+            batch = []
+    SearchPosting.objects.bulk_create(batch)
+
+
+def search_index_rows(kind, objects):
+    # (object id, *indexed fields) of the objects, streamed for add_search_postings
+    model, fields = SEARCH_INDEXED[kind]
+    if kind == 'files':
+        objects = objects.select_related('blob')
+    for indexed in objects.iterator(chunk_size=BULK_BATCH_SIZE):
+        yield search_index_row(indexed, fields)
+
+
+def search_index_row(indexed, fields):
+    # file texts are read from their blobs
+    return (indexed.id, *[indexed.blob.read() if field == 'blob' else getattr(indexed, field) for field in fields])
+
+
+def find_search_postings(kind, groups):
+    # ids of the objects containing every word of at least one of the groups of words, scored by how often
+    # the searched words occur, in one grouped query
+    groups = [set(words) for words in groups if words]
+    if not groups:
+        return SearchPosting.objects.none()
+    counts = {'group_%d' % i: Count('word', filter=Q(word__in=words)) for i, words in enumerate(groups)}
+    postings = SearchPosting.objects.filter(kind=kind, word__in=set().union(*groups)).values('object_id') \
+        .annotate(score=Sum('count'), **counts)
+    found = Q(group_0=len(groups[0]))
+    for i, words in enumerate(groups[1:], 1):
+        found |= Q(**{'group_%d' % i: len(words)})
+    return postings.filter(found)
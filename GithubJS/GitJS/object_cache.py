@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+# part of every key, bumped when cached models change so entries pickled by older code are never read
+OBJECT_CACHE_VERSION = 1
+
+# lookups of this process answered from the cache and from the database
+object_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _version_key(model, pk):
+    return 'object_version:%s:%s' % (model._meta.model_name, pk)
+
+
+def _object_key(model, pk):
+    return 'object:%d:%s:%s' % (OBJECT_CACHE_VERSION, model._meta.model_name, pk)
+
+
+def _versioned_by(model):
+    # rows of models with cached_with set are versioned by the row they belong to, so writes that don't
+    # send signals, like bulk updates or cascades of fast deletes, only have to bump that row
+    owner = getattr(model, 'cached_with', None)
+    if owner is None:
+        return model, lambda row: row.pk
+    return model._meta.get_field(owner).related_model, lambda row: getattr(row, owner + '_id')
+
+
+def get_cached_objects(model, pks):
+    # read-through lookup by primary key; entries keep the version they were stored with and
+    # are ignored once it was bumped, the missing rows are loaded in one query
+    pks = list(dict.fromkeys(pks))
+    version_model, version_id = _versioned_by(model)
+    keys = {pk: _object_key(model, pk) for pk in pks}
+    found = cache.get_many(list(keys.values()) + [_version_key(model, pk) for pk in pks if version_model is model])
+    entries = {pk: found[key] for pk, key in keys.items() if key in found}
+    if version_model is not model:
+        found.update(cache.get_many([_version_key(version_model, version_id(row)) for _, row in entries.values()]))
+
+    objects = {pk: row for pk, (version, row) in entries.items()
+               if version == found.get(_version_key(version_model, version_id(row)), 0)}
+    missing = [pk for pk in pks if pk not in objects]
+    object_cache_stats['hits'] += len(objects)
+    object_cache_stats['misses'] += len(missing)
+    if missing:
+        loaded = model.objects.in_bulk(missing)
+        if version_model is not model:
+            found.update(cache.get_many([_version_key(version_model, version_id(row)) for row in loaded.values()]))
+        cache.set_many({keys[pk]: (found.get(_version_key(version_model, version_id(row)), 0), row)
+                        for pk, row in loaded.items()}, settings.CACHE_TTL)
+        objects.update(loaded)
+    return objects
+
+
+def get_cached_object_or_404(model, pk):
+    row = get_cached_objects(model, [pk]).get(pk)
+    if row is None:
+        raise Http404('No %s matches the given query.' % model._meta.object_name)
+    return row
+
+
+def _increment(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # a missing counter counts as 0, the key is kept until the cache is cleared
+            if not cache.add(key, 1, None):
+                cache.incr(key)
+
+
+def _bump(keys):
+    # bumped right away for the rest of the request, and again after the commit for rows other
+    # requests read from the database before the change was visible to them
+    _increment(keys)
+    transaction.on_commit(lambda: _increment(keys))
+
+
+def uncache_objects(model, pks):
+    _bump([_version_key(model, pk) for pk in pks])
+
+
+def _generation_key(model, pk):
+    return 'generation:%s:%s' % (model._meta.model_name, pk)
+
+
+def get_generation(model, pk):
+    # part of the keys of template fragments showing what belongs to the row, see bump_generation
+    return cache.get(_generation_key(model, pk), 0)
+
+
+def bump_generation(model, pk):
+    # drops every fragment cached under the row's generation at once
+    _bump([_generation_key(model, pk)])
@@ -4,15 +4,17 @@ from django.utils import timezone
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 
-from .models import Project, Comment, GitUser, Reaction, PullRequest, Issue, Branch,\
-    File, Milestone, StarredProject, WatchedProject
+from .models import Project, Comment, GitUser, Reaction, StarredProject, WatchedProject, CACHE_TTL, \
+    FEED_PAGE_SIZE
+from .object_cache import get_cached_object_or_404, get_generation
+from .search import search
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def add_comment(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    can_edit = project.can_edit(request.user.username)
+    project = get_cached_object_or_404(Project, project_id)
+    can_edit = project.can_edit(request.user)
     if request.method == 'GET':
         return HttpResponseRedirect(reverse("single_project", args=(project_id, )))
     else:
@@ -21,17 +23,18 @@ def add_comment(request, project_id):
         if new_comment == '':
             error_message = "You can't submit an empty comment"
         if error_message:
-            starred = len(StarredProject.objects.filter(project_id=project_id, user_id=request.user.pk)) > 0
-            watched = len(WatchedProject.objects.filter(project_id=project_id, user_id=request.user.pk)) > 0
+            starred = StarredProject.objects.filter(project_id=project_id, user_id=request.user.pk).exists()
+            watched = WatchedProject.objects.filter(project_id=project_id, user_id=request.user.pk).exists()
             can_fork = project.lead.id != request.user.pk
             return render(request, "project_view.html", {"project": project, "title": project.title,
                                                          'starred': starred, 'watched': watched,
                                                          'can_fork': can_fork, 'can_edit': can_edit,
                                                          "error_message": error_message,
-                                                         'comments': project.get_comments(request.user.username)})
+                                                         'comments': project.get_comments(request.user.username),
+                                                         'cache_ttl': CACHE_TTL,
+                                                         'generation': get_generation(Project, project.id)})
 
-        new_id = len(Comment.objects.all())+1
-        comment = Comment(id=new_id, text=new_comment, last_update=timezone.now())
+        comment = Comment(text=new_comment, last_update=timezone.now())
         comment.project = project
         comment.user = GitUser.objects.get_by_natural_key(request.user.username)
         comment.project.update_users('Comment added in ' + project.title + ' by ' + request.user.username)
@@ -46,8 +49,7 @@ def toggle_reaction(request, comment_id, reaction_type):
     user = get_object_or_404(GitUser, id=request.user.pk)
     reaction = Reaction.objects.filter(comment=comment, user=user)
     if len(reaction) == 0:
-        new_id = Reaction.objects.all().order_by('-id')[0].id + 1
-        new_reaction = Reaction(id=new_id, user=user, comment=comment, type=reaction_type)
+        new_reaction = Reaction(user=user, comment=comment, type=reaction_type)
         comment.project.update_users('Reaction added for comment ' + str(comment_id) + ' by ' + request.user.username)
         new_reaction.save()
         return HttpResponseRedirect(reverse("single_project", args=(comment.project.id, )))
@@ -72,7 +74,7 @@ def search_app(request):
         return render(request, 'search.html', {'projects_checked': True, 'branches_checked': False,
                                                'files_checked': False, 'issues_checked': False,
                                                'milestones_checked': False, 'requests_checked': False,
-                                               'input_value': ''})
+                                               'comments_checked': False, 'input_value': ''})
     else:
         include_projects = 'include_projects' in request.POST
         include_branches = 'include_branches' in request.POST
@@ -80,24 +82,31 @@ def search_app(request):
         include_issues = 'include_issues' in request.POST
         include_milestones = 'include_milestones' in request.POST
         include_pull_requests = 'include_pull_requests' in request.POST
+        include_comments = 'include_comments' in request.POST
 
         search_value = request.POST['search_value'].strip()
 
-        projects = Project.objects.filter(title__icontains=search_value) if include_projects else None
-        branches = Branch.objects.filter(name__icontains=search_value) if include_branches else None
-        files = File.objects.filter(title__icontains=search_value) if include_files else None
-        issues = Issue.objects.filter(title__icontains=search_value, state='OPEN') if include_issues else None
-        milestones = Milestone.objects.filter(title__icontains=search_value, state='OPEN') \
-            if include_milestones else None
-        pull_requests = PullRequest.objects.filter(title__icontains=search_value, state='OPEN') if \
-            include_pull_requests else None
+        page = request.POST.get('page', '')
+        page = int(page) if page.isdigit() and int(page) > 0 else 1
+
+        projects = search('projects', search_value, page) if include_projects else None
+        branches = search('branches', search_value, page) if include_branches else None
+        files = search('files', search_value, page) if include_files else None
+        issues = search('issues', search_value, page) if include_issues else None
+        milestones = search('milestones', search_value, page) if include_milestones else None
+        pull_requests = search('pull_requests', search_value, page) if include_pull_requests else None
+        comments = search('comments', search_value, page) if include_comments else None
+        full_pages = [len(found) == FEED_PAGE_SIZE
+                      for found in [projects, branches, files, issues, milestones, pull_requests, comments] if found]
 
         return render(request, 'search.html', {'projects': projects, 'branches': branches, 'files': files,
                                                'issues': issues, 'milestones': milestones,
-                                               'pull_requests': pull_requests,
+                                               'pull_requests': pull_requests, 'comments': comments,
                                                'projects_checked': include_projects,
                                                'branches_checked': include_branches,
                                                'files_checked': include_files, 'issues_checked': include_issues,
                                                'milestones_checked': include_milestones,
                                                'requests_checked': include_pull_requests,
-                                               'input_value': search_value})
+                                               'comments_checked': include_comments,
+                                               'input_value': search_value,
+                                               'next_page': page + 1 if any(full_pages) else None})
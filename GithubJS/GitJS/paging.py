@@ -0,0 +1,11 @@
+from .models import FEED_PAGE_SIZE
+
+
+def get_cursor(request, name='before'):
+    # cursor for feed pages: id of the last row of the previous page
+    cursor = request.GET.get(name, '')
+    return int(cursor) if cursor.isdigit() else None
+
+
+def get_next(rows, last_id):
+    return last_id if len(rows) == FEED_PAGE_SIZE else None
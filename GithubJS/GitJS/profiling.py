@@ -0,0 +1,196 @@
+import datetime
+import os
+import time
+
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls
+from .models import Project, GitUser, Branch, Commit, Milestone, Issue, PullRequest, Comment, Reaction, \
+    StarredProject, WatchedProject, Contributor, deliver_queued_updates
+from .object_cache import object_cache_stats
+
+# query counts of the current code, regenerated with profile_views --baseline when they change
+BASELINE = os.path.join(os.path.dirname(__file__), 'query_baseline.json')
+# what the baseline keeps of a profile, timings differ from machine to machine and run to run
+COUNTED = ['queries', 'warm_queries']
+
+# stands for the id of the profiled user in the arguments of a route
+VIEWER = object()
+
+# arguments every route is requested with, on the data of fill_database as seen by user1
+ROUTES = {
+    'index': (),
+    'single_project': (1,),
+    'project_comments': (1,),
+    'add_project': (),
+    'delete_project': (1,),
+    'single_branch': (1,),
+    'branch_archive': (1, 'zip'),
+    'add_branch': (1,),
+    'delete_branch': (2,),
+    'edit_branch': (1,),
+    'set_default': (2,),
+    'copy_branch': (1,),
+    'test_redis_page': (),
+    'git_login': (),
+    'git_logout': (),
+    'git_register': (),
+    'edit_profile': (VIEWER,),
+    'delete_profile': (VIEWER,),
+    'add_starred': (1,),
+    'remove_starred': (2,),
+    'my_starred': (),
+    'add_watched': (2,),
+    'remove_watched': (1,),
+    'my_watched': (),
+    'my_watched_feed': (),
+    'fork': (2,),
+    'my_projects': (),
+    'milestones': (1, 'OPEN'),
+    'add_milestone': (1,),
+    'edit_milestone': (1,),
+    'toggle_milestone': (1,),
+    'upcoming_milestones': (),
+    'add_file': (1,),
+    'edit_file': (1,),
+    'delete_file': (1,),
+    'raw_file': (1,),
+    'upload_file': (1,),
+    'contributors': (1,),
+    'contributor_candidates': (1,),
+    'add_contributor': (1,),
+    'remove_contributor': (1, 'user4'),
+    'add_comment': (1,),
+    'toggle_reaction': (1, 'LIKE'),
+    'issues': (1, 'OPEN'),
+    'add_issue': (1,),
+    'edit_issue': (1,),
+    'toggle_issue': (1,),
+    'milestone_issues': (1, 'OPEN'),
+    'commits': (1,),
+    'pull_requests': (1, 'OPEN'),
+    'add_pull_request': (1,),
+    'edit_pull_request': (1,),
+    'toggle_request_state': (1,),
+    'get_merge_changes': (1,),
+    'merge_request': (1,),
+    'search_app': (),
+}
+
+# routes that only take form submissions are profiled posting the data made by these
+POSTED = {
+    'add_contributor': lambda: {'new_contributor': 'user2'},
+    'upload_file': lambda: {'file': SimpleUploadedFile('Profiled upload', b'Uploaded text')},
+}
+
+
+def grow_fixture(start, stop):
+    # rows number start to stop - 1 of every kind the pages of project 1, branch 1 and user1 list
+    viewer = GitUser.objects.get_by_natural_key('user1')
+    project = Project.objects.get(id=1)
+    branch = Branch.objects.get(id=1)
+    now = timezone.now()
+    for i in range(start, stop):
+        name = 'Profiled ' + str(i)
+        user = GitUser(username='profiled_' + str(i), password='!')
+        user.save()
+        Contributor(project=project, user=user).save()
+        StarredProject(project=project, user=user).save()
+        own = Project(title=name, lead=viewer)
+        own.save()
+        StarredProject(project=own, user=viewer).save()
+        WatchedProject(project=own, user=viewer).save()
+        own.update_users(name + ' changed')
+        Branch(name=name, default=False, project=project).save()
+        branch.add_file(name, 'Text of ' + name)
+        Commit(log_message='File ' + name + ' added', date_time=now, branch=branch, committer='user1').save()
+        milestone = Milestone(title=name, description=name, due_date=now + datetime.timedelta(days=i + 1),
+                              state='OPEN', project=project)
+        milestone.save()
+        Issue(title=name, description=name, state='OPEN', project=project, milestone_id=1, assignee=user).save()
+        PullRequest(title=name, description=name, state='OPEN', project=project, source=branch,
+                    target_id=2).save()
+        comment = Comment(text=name, last_update=now, user=user, project=project)
+        comment.save()
+        Reaction(type='LIKE', user=viewer, comment=comment).save()
+    deliver_queued_updates()
+
+
+class _QueryTimer:
+    # counts the queries run through the connection and the time spent in the database
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.time += time.perf_counter() - start
+
+
+def _request(client, name, path):
+    # changes made by the request are rolled back, every route sees the same data
+    hits = object_cache_stats['hits']
+    with transaction.atomic():
+        timer = _QueryTimer()
+        with connection.execute_wrapper(timer):
+            start = time.perf_counter()
+            response = client.post(path, POSTED[name]()) if name in POSTED else client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            response_time = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return response.status_code, timer, response_time, object_cache_stats['hits'] - hits
+
+
+def _profile_route(name, args, viewer):
+    client = Client(raise_request_exception=False)
+    client.force_login(viewer)
+    path = reverse(name, args=[viewer.pk if arg is VIEWER else arg for arg in args])
+    cache.clear()
+    status, timer, response_time, _ = _request(client, name, path)
+    # once more with what the first request left in the cache
+    client.force_login(viewer)
+    _, warm_timer, _, warm_hits = _request(client, name, path)
+    return {'status': status, 'queries': timer.queries, 'sql_time': round(timer.time, 5),
+            'response_time': round(response_time, 5), 'warm_queries': warm_timer.queries,
+            'warm_cache_hits': warm_hits}
+
+
+def profile_views(scales):
+    # the data grows to every scale in turn and each route is requested again
+    names = [pattern.name for pattern in urls.urlpatterns]
+    missing = [name for name in names if name not in ROUTES]
+    if missing:
+        raise KeyError('No profiled arguments for routes: ' + ', '.join(missing))
+    viewer = GitUser.objects.get_by_natural_key('user1')
+    views = {name: {} for name in names}
+    grown = 0
+    for scale in sorted(scales):
+        grow_fixture(grown, scale)
+        grown = scale
+        for name in names:
+            views[name][str(scale)] = _profile_route(name, ROUTES[name], viewer)
+    return {'scales': sorted(scales), 'views': views}
+
+
+def baseline_counts(profile):
+    return {'scales': profile['scales'],
+            'views': {name: {scale: {field: counted[field] for field in COUNTED} for scale, counted in counts.items()}
+                      for name, counts in profile['views'].items()}}
+
+
+def growing_views(profile):
+    # views whose query count depends on the amount of data, usually a query per listed row
+    smallest, largest = str(profile['scales'][0]), str(profile['scales'][-1])
+    return sorted(name for name, counts in profile['views'].items()
+                  if counts[largest]['queries'] > counts[smallest]['queries'])
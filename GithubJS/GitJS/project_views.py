@@ -1,44 +1,46 @@
-from django.http import Http404, HttpResponseRedirect
+from django.db.models import Exists, OuterRef
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse
 
-from .models import Project, Branch, GitUser, StarredProject, WatchedProject, \
-    Contributor, File, Commit
+from .models import Project, GitUser, Contributor, StarredProject, WatchedProject, CACHE_TTL, CANDIDATE_LIMIT
+from .object_cache import get_cached_object_or_404, get_generation
+from .paging import get_cursor, get_next
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def single_project(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    user = get_object_or_404(GitUser, id=request.user.pk)
-    can_fork = project.lead.id != user.id
-    can_edit = project.can_edit(user.username)
-    try:
-        starred = StarredProject.objects.get(project_id=project_id, user_id=request.user.pk)
-        try:
-            watched = WatchedProject.objects.get(project_id=project_id, user_id=request.user.pk)
-            return render(request, 'project_view.html', {'title': project.title, "project": project,
-                                                         "starred": True, "watched": True, "can_fork": can_fork,
-                                                         'comments': project.get_comments(user.username),
-                                                         'can_edit': can_edit})
-        except:
-            return render(request, 'project_view.html', {'title': project.title, "project": project,
-                                                         "starred": True, "watched": False, "can_fork": can_fork,
-                                                         'comments': project.get_comments(user.username),
-                                                         'can_edit': can_edit})
-    except:
-        try:
-            watched = WatchedProject.objects.get(project_id=project_id, user_id=request.user.pk)
-            return render(request, 'project_view.html', {'title': project.title, "project": project,
-                                                         "starred": False, "watched": True, "can_fork": can_fork,
-                                                         'comments': project.get_comments(user.username),
-                                                         'can_edit': can_edit})
-        except:
-            return render(request, 'project_view.html', {'title': project.title, "project": project,
-                                                         "starred": False, "watched": False, "can_fork": can_fork,
-                                                         'comments': project.get_comments(user.username),
-                                                         'can_edit': can_edit})
+    # the project with the viewer's star, watch and contributor rows takes one query,
+    # the branches are listed by the template unless their fragment is cached
+    viewer = {'project': OuterRef('pk'), 'user_id': request.user.pk}
+    projects = Project.objects.select_related('lead', 'forked_from__lead') \
+        .annotate(starred=Exists(StarredProject.objects.filter(**viewer)),
+                  watched=Exists(WatchedProject.objects.filter(**viewer)),
+                  contributing=Exists(Contributor.objects.filter(**viewer)))
+    project = get_object_or_404(projects, id=project_id)
+    can_edit = project.lead_id == request.user.pk or project.contributing
+    comments = project.get_comments(request.user.username, get_cursor(request))
+    next_comments = get_next(comments, comments[-1]['comment'].id if comments else None)
+    return render(request, 'project_view.html', {'title': project.title, "project": project,
+                                                 "starred": project.starred, "watched": project.watched,
+                                                 "can_fork": project.lead_id != request.user.pk,
+                                                 'comments': comments, 'next_comments': next_comments,
+                                                 'can_edit': can_edit, 'cache_ttl': CACHE_TTL,
+                                                 'generation': get_generation(Project, project.id)})
+
+
+@login_required(login_url='login/')
+@permission_required('GitJS.can_view', raise_exception=True)
+def project_comments(request, project_id):
+    project = get_cached_object_or_404(Project, project_id)
+    comments = project.get_comments(request.user.username, get_cursor(request))
+    return JsonResponse({'comments': [{'id': comment['comment'].id, 'user': comment['comment'].user.username,
+                                       'text': comment['comment'].text,
+                                       'last_update': comment['comment'].last_update,
+                                       'reaction': comment['reaction']} for comment in comments],
+                         'next': get_next(comments, comments[-1]['comment'].id if comments else None)})
 
 
 @login_required(login_url='login/')
@@ -52,14 +54,17 @@ def starred_projects(request):
 @permission_required('GitJS.can_view', raise_exception=True)
 def my_projects(request):
     user = get_object_or_404(GitUser, id=request.user.pk)
-    return render(request, 'projects.html', {'title': 'My projects', 'projects': user.get_my_projects(),
-                                             'can_add': True})
+    projects = list(user.get_my_projects(get_cursor(request, 'after')))
+    next_projects = get_next(projects, projects[-1].id if projects else None)
+    return render(request, 'projects.html', {'title': 'My projects', 'projects': projects, 'can_add': True,
+                                             'next_projects': next_projects})
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def add_starred(request, project_id):
     user = get_object_or_404(GitUser, id=request.user.pk)
+    get_cached_object_or_404(Project, project_id)
     user.add_starred(project_id)
     return redirect('index')
 
@@ -76,13 +81,26 @@ def remove_starred(request, project_id):
 @permission_required('GitJS.can_view', raise_exception=True)
 def watched_project_changes(request):
     user = get_object_or_404(GitUser, id=request.user.pk)
-    return render(request, 'updates.html', {'title': 'Watched project changes', 'changes': user.get_watched_changes()})
+    changes = list(user.get_watched_changes(get_cursor(request)))
+    return render(request, 'updates.html', {'title': 'Watched project changes', 'changes': changes,
+                                            'next_changes': get_next(changes, changes[-1].id if changes else None)})
+
+
+@login_required(login_url='login/')
+@permission_required('GitJS.can_view', raise_exception=True)
+def watched_project_changes_feed(request):
+    user = get_object_or_404(GitUser, id=request.user.pk)
+    changes = list(user.get_watched_changes(get_cursor(request)))
+    return JsonResponse({'changes': [{'id': change.id, 'project_id': change.project_id, 'message': change.message,
+                                      'up_date': change.up_date} for change in changes],
+                         'next': get_next(changes, changes[-1].id if changes else None)})
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def add_watched(request, project_id):
     user = get_object_or_404(GitUser, id=request.user.pk)
+    get_cached_object_or_404(Project, project_id)
     user.add_watched(project_id)
     return redirect('index')
 
@@ -99,73 +117,51 @@ def remove_watched(request, project_id):
 @permission_required('GitJS.can_view', raise_exception=True)
 def fork_project(request, project_id):
     user = get_object_or_404(GitUser, id=request.user.pk)
-    for_fork = get_object_or_404(Project, id=project_id)
-    new_project = Project(id=Project.objects.all().order_by('-id')[0].id + 1, lead=user)
-    new_project.forked_from = for_fork
-    needs_new_title = True
-    new_title = '' + for_fork.title
-    while needs_new_title:
-        try:
-            possible_existing = Project.objects.get(lead=user, title=new_title)
-            new_title += '_'
-        except:
-            new_project.title = new_title
-            needs_new_title = False
-    new_project.save()
-
-    for branch in Branch.objects.filter(project=for_fork):
-
-        new_id = Branch.objects.all().order_by('-id')[0].id + 1
-        branch_copy = Branch(id=new_id, name=branch.name, project=new_project, default=branch.default)
-        branch_copy.save()
-
-        for file in branch.get_files():
-            new_file_id = File.objects.all().order_by('-id')[0].id + 1
-            new_file = File(id=new_file_id, title=file.title, text=file.text, branch=branch_copy)
-            new_file.save()
-
-        for commit in branch.get_commits():
-            new_commit_id = Commit.objects.all().order_by('-id')[0].id + 1
-            new_commit = Commit(id=new_commit_id, log_message=commit.log_message, branch=branch_copy,
-                                date_time=commit.date_time, committer=commit.committer)
-            new_commit.save()
-
+    for_fork = get_cached_object_or_404(Project, project_id)
+    for_fork.fork(user)
     return redirect('index')
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def contributors(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
+    project = get_cached_object_or_404(Project, project_id)
     if project.lead.username != request.user.username:
         raise Http404()
     return render(request, 'contributors.html', {'title': 'Contributors', 'contributors': project.get_contributors(),
                                                  'form_action': 'add_contributor/'+str(project_id),
-                                                 'other_users': project.get_noncontributors(),
+                                                 'other_users': project.get_noncontributors(limit=CANDIDATE_LIMIT),
                                                  'project_id': project_id})
 
 
+@login_required(login_url='login/')
+@permission_required('GitJS.can_view', raise_exception=True)
+def contributor_candidates(request, project_id):
+    project = get_cached_object_or_404(Project, project_id)
+    if project.lead.username != request.user.username:
+        raise Http404()
+    prefix = request.GET.get('q', '').strip()
+    return JsonResponse({'users': project.get_noncontributors(prefix, CANDIDATE_LIMIT)})
+
+
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def add_contributor(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
+    project = get_cached_object_or_404(Project, project_id)
     if project.lead.username != request.user.username:
         raise Http404()
-    new_contributor = request.POST['new_contributor'].strip()
-    new_id = Contributor.objects.all().order_by('-id')[0].id + 1
-    con = Contributor(id=new_id, username=new_contributor, project_id=project_id)
-    con.save()
+    new_contributor = get_object_or_404(GitUser, username=request.POST['new_contributor'].strip())
+    project.add_contributor(new_contributor)
     return HttpResponseRedirect(reverse("single_project", args=(project.id,)))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def remove_contributor(request, project_id, username):
-    project = get_object_or_404(Project, id=project_id)
+    project = get_cached_object_or_404(Project, project_id)
     if project.lead.username != request.user.username:
         raise Http404()
-    contributor = Contributor.objects.get(username=username, project_id=project_id)
-    contributor.delete()
+    project.remove_contributor(get_object_or_404(GitUser, username=username))
     return HttpResponseRedirect(reverse("single_project", args=(project.id,)))
 
 
@@ -187,15 +183,14 @@ def add_project(request):
         if error_message:
             return render(request, 'project_form.html', {'input_value': '', 'error_message': error_message})
 
-        new_id = Project.objects.all().order_by('-id')[0].id + 1
-        new_project = Project(id=new_id, title=new_title, lead=user)
+        new_project = Project(title=new_title, lead=user)
         new_project.save()
-        return HttpResponseRedirect(reverse("single_project", args=(new_id,)))
+        return HttpResponseRedirect(reverse("single_project", args=(new_project.id,)))
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def delete_project(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
+    project = get_cached_object_or_404(Project, project_id)
     project.delete()
     return redirect('my_projects')
@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from django.utils import timezone
@@ -5,13 +6,14 @@ from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 
 from .models import Project, PullRequest, Issue, Branch, Commit
+from .object_cache import get_cached_object_or_404
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def view_pull_requests(request, project_id, state):
-    project = get_object_or_404(Project, id=project_id)
-    can_edit = project.can_edit(request.user.username)
+    project = get_cached_object_or_404(Project, project_id)
+    can_edit = project.can_edit(request.user)
     return render(request, 'pull_requests.html', {'title': 'Pull requests for ' + project.title,
                                                   'project_id': project_id, 'can_edit': can_edit,
                                                   'pull_requests': project.get_pull_requests(state)})
@@ -20,8 +22,8 @@ def view_pull_requests(request, project_id, state):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def add_pull_request(request, project_id):
-    project = get_object_or_404(Project, id=project_id)
-    can_edit = project.can_edit(request.user.username)
+    project = get_cached_object_or_404(Project, project_id)
+    can_edit = project.can_edit(request.user)
     if len(Branch.objects.filter(project=project, default=True)) > 0:
         default_branch_name = Branch.objects.filter(project=project, default=True)[0].name
     else:
@@ -74,8 +76,7 @@ def add_pull_request(request, project_id):
                                                     'issues': project.get_issues('OPEN'),
                                                     'form_action': str(project_id)+'/add_pull_request'})
 
-        new_id = PullRequest.objects.all().order_by('-id')[0].id + 1
-        new_pr = PullRequest(id=new_id, project=project, title=new_title, description=new_desc, state='OPEN')
+        new_pr = PullRequest(project=project, title=new_title, description=new_desc, state='OPEN')
         if new_issue != 'None':
             new_pr.issue = Issue.objects.get(title=new_issue)
         new_pr.source = Branch.objects.get(name=source_branch)
@@ -90,9 +91,9 @@ def add_pull_request(request, project_id):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def edit_pull_request(request, pr_id):
-    pull_request = get_object_or_404(PullRequest, id=pr_id)
+    pull_request = get_cached_object_or_404(PullRequest, pr_id)
     issue_title = pull_request.issue.title if pull_request.issue is not None else 'None'
-    can_edit = pull_request.project.can_edit(request.user.username)
+    can_edit = pull_request.project.can_edit(request.user)
     if request.method == 'GET':
         return render(request, "pr_form.html", {"title": "Pull request #"+str(pr_id),
                                                 'project_id': pull_request.project.id,
@@ -167,7 +168,7 @@ def edit_pull_request(request, pr_id):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def toggle_request_state(request, pr_id):
-    pull_request = get_object_or_404(PullRequest, id=pr_id)
+    pull_request = get_cached_object_or_404(PullRequest, pr_id)
     if pull_request.state == 'OPEN':
         pull_request.state = 'CLOSED'
     else:
@@ -179,32 +180,31 @@ def toggle_request_state(request, pr_id):
 @login_required(login_url='login/')
 @permission_required('GitJS.can_view', raise_exception=True)
 def get_merge_changes(request, pr_id):
-    pull_request = get_object_or_404(PullRequest, id=pr_id)
-    differences = pull_request.get_differences()
+    pull_request = get_object_or_404(PullRequest.objects.select_related('source', 'target'), id=pr_id)
     return render(request, 'merge_changes.html', {'title': 'Changes for PR#'+str(pr_id),
                                                   'project_id': pull_request.project.id,
-                                                  'changes': differences, 'pr_id': pr_id})
+                                                  'changes': pull_request.get_file_diffs(), 'pr_id': pr_id})
 
 
 @login_required(login_url='login/')
 @permission_required('GitJS.can_edit', raise_exception=True)
 def merge_request(request, pr_id):
-    pull_request = get_object_or_404(PullRequest, id=pr_id)
-    pull_request.merge_branches()
-    new_commit_id = Commit.objects.all().order_by('-id')[0].id + 1
-    commit = Commit(id=new_commit_id, branch=pull_request.target, committer=request.user.username,
-                    date_time=timezone.now())
-    commit.log_message = 'Merged from ' + pull_request.source.name
-    commit.save()
-
-    issue = pull_request.issue
-    if issue is not None:
-        issue.state = 'CLOSED'
-        issue.save()
-
-    project_id = pull_request.project.id
-    pull_request.state = 'MERGED'
-    pull_request.source = None
-    pull_request.target = None
-    pull_request.save()
+    pull_request = get_cached_object_or_404(PullRequest, pr_id)
+    with transaction.atomic():
+        summary = pull_request.merge_branches()
+        commit = Commit(branch=pull_request.target, committer=request.user.username, date_time=timezone.now())
+        commit.log_message = 'Merged from %s: %d added, %d modified, %d unchanged' % (
+            pull_request.source.name, summary['added'], summary['modified'], summary['unchanged'])
+        commit.save()
+
+        issue = pull_request.issue
+        if issue is not None:
+            issue.state = 'CLOSED'
+            issue.save()
+
+        project_id = pull_request.project.id
+        pull_request.state = 'MERGED'
+        pull_request.source = None
+        pull_request.target = None
+        pull_request.save()
     return HttpResponseRedirect(reverse("pull_requests", args=(project_id, 'OPEN',)))
\ No newline at end of file
@@ -0,0 +1,113 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Project, Branch, File, Issue, Milestone, PullRequest, Comment, FEED_PAGE_SIZE, \
+    SEARCH_INDEXED, find_search_postings, search_words
+
+# kind of result: (title field matched by substring, text fields matched by word, rows that can be found)
+SEARCHED = {
+    'projects': ('title', [], lambda: Project.objects.select_related('lead')),
+    'branches': ('name', [], lambda: Branch.objects.select_related('project__lead')),
+    'files': ('title', ['blob__text'], lambda: File.objects.filter(deleted=False, replaced_by__isnull=True)
+              .select_related('branch__project__lead', 'blob')),
+    'issues': ('title', ['description'], lambda: Issue.objects.filter(state='OPEN').select_related('project__lead')),
+    'milestones': ('title', ['description'],
+                   lambda: Milestone.objects.filter(state='OPEN').select_related('project__lead')),
+    'pull_requests': ('title', ['description'],
+                      lambda: PullRequest.objects.filter(state='OPEN').select_related('project__lead')),
+    'comments': (None, ['text'], lambda: Comment.objects.select_related('project__lead', 'user')),
+}
+
+
+def search(kind, term, page=1):
+    title_field, text_fields, rows = SEARCHED[kind]
+    if settings.SEARCH_INDEX and kind in SEARCH_INDEXED:
+        found = _search_index(kind, rows(), title_field, term)
+    elif connection.vendor == 'postgresql':
+        found = _search_postgres(rows(), title_field, text_fields, term)
+    else:
+        found = _search_python(rows(), title_field, text_fields, term)
+    start = (page - 1) * FEED_PAGE_SIZE
+    return list(found[start:start + FEED_PAGE_SIZE])
+
+
+def _phrases(term):
+    # "a b or c" finds what contains both a and b or contains c, the way websearch queries of postgres do
+    return [phrase for phrase in re.split(r'\s+or\s+', term.strip(), flags=re.IGNORECASE) if phrase]
+
+
+def _title_match(title_field, term):
+    found = Q(pk__in=[])
+    if title_field:
+        for phrase in _phrases(term):
+            found |= Q(**{title_field + '__icontains': phrase})
+    return found
+
+
+def _search_index(kind, rows, title_field, term):
+    # postings of deleted or replaced rows are dropped by joining them with the rows that can be found,
+    # ranking and paging are left to the database
+    postings = find_search_postings(kind, [search_words(phrase) for phrase in _phrases(term)])
+    score = Subquery(postings.filter(object_id=OuterRef('id')).values('score')[:1])
+    return rows.filter(Q(id__in=postings.values('object_id')) | _title_match(title_field, term)) \
+        .annotate(score=Coalesce(score, 0)).order_by('-score', 'id')
+
+
+def _search_postgres(rows, title_field, text_fields, term):
+    # every table is matched with the expression of its own gin index from migration 0002, fields of
+    # related rows like the blob text of files through a subquery on their table, and the matches are joined
+    # with or; only the rows found are ranked
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+    query = SearchQuery(term, config='simple', search_type='websearch')
+    fields = [field for field in [title_field, *text_fields] if field]
+    local = [field for field in fields if '__' not in field]
+    found = _title_match(title_field, term)
+    if local:
+        rows = rows.annotate(document=SearchVector(*local, config='simple'))
+        found |= Q(document=query)
+    for field in fields:
+        if '__' in field:
+            relation, related_field = field.split('__', 1)
+            related = rows.model._meta.get_field(relation).related_model.objects \
+                .annotate(document=SearchVector(related_field, config='simple')).filter(document=query)
+            found |= Q(**{relation + '__in': related.values('pk')})
+    rank = SearchRank(SearchVector(*fields, config='simple'), query)
+    return rows.filter(found).annotate(rank=rank).order_by('-rank', 'id')
+
+
+def _value(row, field):
+    for name in field.split('__'):
+        row = getattr(row, name)
+    return row
+
+
+def _search_python(rows, title_field, text_fields, term):
+    # inverted index over the candidate rows, ranked by how often the searched words occur
+    index = {}
+    rows_by_id = {}
+    found = {}
+    phrases = [phrase.lower() for phrase in _phrases(term)]
+    for row in rows.iterator():
+        rows_by_id[row.id] = row
+        if title_field and any(phrase in _value(row, title_field).lower() for phrase in phrases):
+            found[row.id] = row
+        for field in [title_field, *text_fields]:
+            if field:
+                for word in search_words(_value(row, field)):
+                    postings = index.setdefault(word, {})
+                    postings[row.id] = postings.get(row.id, 0) + 1
+
+    groups = [set(search_words(phrase)) for phrase in phrases]
+    words = set().union(*groups)
+    scores = {}
+    for group in groups:
+        if group:
+            matching = set.intersection(*[set(index.get(word, {})) for word in group])
+            for row_id in matching:
+                found[row_id] = rows_by_id[row_id]
+                scores[row_id] = sum(index[word].get(row_id, 0) for word in words if word in index)
+    return sorted(found.values(), key=lambda row: (-scores.get(row.id, 0), row.id))
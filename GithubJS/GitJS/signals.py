@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Project, Branch, Milestone, Comment, Commit, File, Issue, PullRequest, SearchPosting, \
+    SEARCH_INDEXED, add_search_postings, search_index_row
+from .object_cache import bump_generation, uncache_objects
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Branch)
+@receiver(post_save, sender=Milestone)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=PullRequest)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Branch)
+@receiver(post_delete, sender=Milestone)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=PullRequest)
+def uncache_object(sender, instance, created=False, **kwargs):
+    # new rows can't be cached yet
+    if not created:
+        uncache_objects(sender, [instance.pk])
+
+
+@receiver(post_save, sender=File)
+def uncache_file(sender, instance, created, **kwargs):
+    # deleted files are uncached by File.delete and by the receivers of their branch
+    if not created:
+        uncache_objects(Branch, [instance.branch_id])
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def bump_branch_generations(sender, instance, **kwargs):
+    bump_generation(Branch, instance.pk)
+    bump_generation(Project, instance.project_id)
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Commit)
+def bump_branch_generation(sender, instance, **kwargs):
+    # files are deleted through File.delete or with their branch, commits only with their branch
+    bump_generation(Branch, instance.branch_id)
+
+
+def _search_kind(model):
+    for kind, (indexed_model, fields) in SEARCH_INDEXED.items():
+        if indexed_model == model:
+            return kind, fields
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=PullRequest)
+@receiver(post_save, sender=Comment)
+def index_search_text(sender, instance, created, **kwargs):
+    if settings.SEARCH_INDEX:
+        kind, fields = _search_kind(sender)
+        if not created:
+            SearchPosting.objects.filter(kind=kind, object_id=instance.id).delete()
+        add_search_postings(kind, [search_index_row(instance, fields)])
+
+
+# files have no delete receiver: it would stop branches from deleting their files in bulk after copies
+# are detached, so postings of deleted files are left to search.py to skip and to rebuild_search_index
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=PullRequest)
+@receiver(post_delete, sender=Comment)
+def unindex_search_text(sender, instance, **kwargs):
+    if settings.SEARCH_INDEX:
+        kind, fields = _search_kind(sender)
+        SearchPosting.objects.filter(kind=kind, object_id=instance.id).delete()
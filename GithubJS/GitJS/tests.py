@@ -1,8 +1,26 @@
-from django.test import TestCase, Client
+import datetime
+import io
+import json
+import tarfile
+import zipfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import F
+from django.http import Http404
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from .management.commands.fill_database import Command
-from .models import Project, GitUser, Branch, Milestone, File, Comment, Reaction, Issue, PullRequest, Commit
+from .object_cache import get_cached_object_or_404, get_cached_objects, object_cache_stats
+from .profiling import BASELINE, COUNTED, growing_views, profile_views
+from .search import search
+from .models import Project, GitUser, Branch, Milestone, File, Comment, Reaction, Issue, PullRequest, Commit, \
+    ProjectUpdate, QueuedUpdate, StarredProject, WatchedProject, SearchPosting, Blob, \
+    deliver_queued_updates, FEED_PAGE_SIZE
 
 
 class InitialTests(TestCase):
@@ -15,6 +33,8 @@ class InitialTests(TestCase):
     def setUp(self) -> None:
         # instantiate client for each test
         self.client = Client()
+        # cached values would outlive the rolled back data of the previous test
+        cache.clear()
 
     # method only used in initial testing
     def test_branch_count(self):
@@ -123,6 +143,9 @@ class InitialTests(TestCase):
         user5 = GitUser.objects.get(username='user5')
         starred2 = user5.get_starred_projects()
         self.assertTrue(starred2[0].title == 'Project 1')
+        # the starred page shows the leads too, they come with the same query
+        with self.assertNumQueries(1):
+            self.assertEqual([project.lead.username for project in user5.get_starred_projects()], ['user1'])
 
     def test_add_starred(self):
         user5 = GitUser.objects.get(username='user5')
@@ -130,6 +153,17 @@ class InitialTests(TestCase):
         user5.add_starred(3)
         self.assertTrue(len(user5.get_starred_projects()) > starred_before)
 
+    def test_add_starred_twice(self):
+        user5 = GitUser.objects.get(username='user5')
+        user5.add_starred(3)
+        user5.add_starred(3)
+        self.assertEqual(len(StarredProject.objects.filter(user_id=user5.pk, project_id=3)), 1)
+
+    def test_delete_project_removes_stars(self):
+        Project.objects.get(id=1).delete()
+        self.assertEqual(len(StarredProject.objects.filter(project_id=1)), 0)
+        self.assertEqual(len(WatchedProject.objects.filter(project_id=1)), 0)
+
     def test_remove_starred(self):
         user5 = GitUser.objects.get(username='user5')
         starred_before = len(user5.get_starred_projects())
@@ -154,6 +188,7 @@ class InitialTests(TestCase):
         user5.add_watched(3)
         watched_project = Project.objects.get(id=3)
         watched_project.update_users("Generic update message")
+        deliver_queued_updates()
         self.assertTrue(len(user5.get_watched_changes()) > watched_before)
 
     def test_remove_watched(self):
@@ -162,8 +197,36 @@ class InitialTests(TestCase):
         user5.remove_watched(1)
         unwatched_project = Project.objects.get(id=3)
         unwatched_project.update_users("Generic update message")
+        deliver_queued_updates()
         self.assertTrue(len(user5.get_watched_changes()) == watched_before)
 
+    def test_update_users_queued(self):
+        project = Project.objects.get(id=1)
+        updates_before = len(ProjectUpdate.objects.filter(project_id=1))
+        with self.assertNumQueries(1):
+            project.update_users("Generic update message")
+        self.assertEqual(len(ProjectUpdate.objects.filter(project_id=1)), updates_before)
+        self.assertEqual(len(QueuedUpdate.objects.all()), 1)
+
+        deliver_queued_updates()
+        self.assertEqual(len(QueuedUpdate.objects.all()), 0)
+        # project 1 is watched by user1 and user5
+        self.assertEqual(len(ProjectUpdate.objects.filter(project_id=1)), updates_before + 2)
+
+    @override_settings(WATCHED_CHANGES_MODE='read')
+    def test_watched_changes_read_mode(self):
+        project = Project.objects.get(id=3)
+        project.update_users('Before watching')
+        user5 = GitUser.objects.get(username='user5')
+        user5.add_watched(3)
+        project.update_users('After watching')
+        Project.objects.get(id=2).update_users('Not watched')
+
+        changes = user5.get_watched_changes()
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].message, 'After watching')
+        self.assertEqual(len(QueuedUpdate.objects.all()), 0)
+
     def test_get_starred_client(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -210,6 +273,7 @@ class InitialTests(TestCase):
         self.assertRedirects(response, '/')
         watched_project = Project.objects.get(id=3)
         watched_project.update_users('Generic update message')
+        deliver_queued_updates()
         response = self.client.get('http://localhost:8000/my_watched', follow=True)
         self.assertEqual(response.context['changes'][0].message, 'Generic update message')
 
@@ -221,6 +285,7 @@ class InitialTests(TestCase):
         self.assertRedirects(response, '/')
         watched_project = Project.objects.get(id=3)
         watched_project.update_users('Generic update message')
+        deliver_queued_updates()
         response = self.client.get('http://localhost:8000/my_watched', follow=True)
         self.assertNotEqual(response.context['changes'][0].message, 'Generic update message')
 
@@ -255,6 +320,30 @@ class InitialTests(TestCase):
                 self.assertEqual(forked.get_branches()[i].get_commits()[j].log_message,
                                  new_project.get_branches()[i].get_commits()[j].log_message)
 
+    def test_fork_title_taken(self):
+        user = GitUser.objects.get(username='user1')
+        project = Project.objects.get(id=2)
+
+        first = project.fork(user)
+        second = project.fork(user)
+        self.assertEqual(first.title, 'Project 2')
+        self.assertEqual(second.title, 'Project 2_')
+        self.assertEqual(len(second.get_branches()), len(project.get_branches()))
+        self.assertEqual(len(second.get_branches()[0].get_commits()), len(project.get_branches()[0].get_commits()))
+
+    def test_fork_outlives_original(self):
+        user = GitUser.objects.get(username='user1')
+        project = Project.objects.get(id=2)
+        fork = project.fork(user)
+        titles = [[file.title for file in branch.get_files()] for branch in project.get_branches()]
+
+        # deleting the lead deletes their projects, copies elsewhere get their own rows first
+        project.lead.delete()
+        self.assertFalse(Project.objects.filter(id=2).exists())
+        for branch, branch_titles in zip(fork.get_branches(), titles):
+            self.assertIsNone(branch.parent)
+            self.assertEqual([file.title for file in branch.get_files()], branch_titles)
+
     def test_edit_branch_successful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -358,6 +447,25 @@ class InitialTests(TestCase):
         self.assertNotEqual(milestone_before.description, milestone_after.description)
         self.assertNotEqual(milestone_before.due_date, milestone_after.due_date)
 
+    def test_milestone_saves_keep_issue_counters(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+        due_date = (timezone.now() + datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+
+        # an issue of the milestone opened by another request after this one read the milestone
+        get_cached_object_or_404(Milestone, 1)
+        Milestone.objects.filter(id=1).update(open_issue_count=F('open_issue_count') + 1)
+        counted = Milestone.objects.get(id=1).open_issue_count
+        context = {'new_title': 'Kept counters', 'new_desc': 'New Description', 'due_date': due_date}
+        self.client.post(reverse('edit_milestone', args=(1,)), context)
+        self.assertEqual(Milestone.objects.get(id=1).open_issue_count, counted)
+
+        get_cached_object_or_404(Milestone, 1)
+        Milestone.objects.filter(id=1).update(open_issue_count=F('open_issue_count') + 1)
+        self.client.get(reverse('toggle_milestone', args=(1,)))
+        milestone = Milestone.objects.get(id=1)
+        self.assertEqual((milestone.state, milestone.open_issue_count), ('CLOSED', counted + 1))
+
     def test_edit_milestone_unsuccessful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -453,14 +561,14 @@ class InitialTests(TestCase):
         self.client.post(reverse('edit_file', args=(3,)), context, follow=True)
         file_after = File.objects.get(id=3)
         self.assertNotEqual(file_before.title, file_after.title)
-        self.assertNotEqual(file_before.text, file_after.text)
+        self.assertNotEqual(file_before.blob.read(), file_after.blob.read())
 
         context = {'new_title': 'File 2', 'new_text': 'Generic text for file 2 on branch 2'}
         file_before = File.objects.get(id=3)
         self.client.post(reverse('edit_file', args=(3,)), context, follow=True)
         file_after = File.objects.get(id=3)
         self.assertNotEqual(file_before.title, file_after.title)
-        self.assertNotEqual(file_before.text, file_after.text)
+        self.assertNotEqual(file_before.blob.read(), file_after.blob.read())
 
     def test_edit_file_unsuccessful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
@@ -483,6 +591,124 @@ class InitialTests(TestCase):
         self.client.post(reverse('delete_file', args=(2,)), context, follow=True)
         self.assertTrue(len(File.objects.filter(branch=branch)) < size_before)
 
+    def test_raw_file(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        response = self.client.get(reverse('raw_file', args=(1,)))
+        self.assertEqual(b''.join(response.streaming_content), b'Generic text for file 1 on branch 1')
+        etag = response['ETag']
+
+        response = self.client.get(reverse('raw_file', args=(1,)), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse('raw_file', args=(1,)), HTTP_RANGE='bytes=8-11')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 8-11/35')
+        self.assertEqual(b''.join(response.streaming_content), b'text')
+
+        response = self.client.get(reverse('raw_file', args=(1,)), HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        response = self.client.get(reverse('raw_file', args=(1,)), HTTP_RANGE='bytes=5-2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'Generic text for file 1 on branch 1')
+
+    def test_object_cache(self):
+        with self.assertNumQueries(1):
+            branches = get_cached_objects(Branch, [1, 2, 99])
+        self.assertEqual(sorted(branches), [1, 2])
+        hits = object_cache_stats['hits']
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_object_or_404(Branch, 1).name, 'Branch 1')
+        self.assertEqual(object_cache_stats['hits'], hits + 1)
+
+        branch = Branch.objects.get(id=1)
+        branch.name = 'Renamed'
+        branch.save()
+        self.assertEqual(get_cached_object_or_404(Branch, 1).name, 'Renamed')
+
+        # files go with any change of their branch, deletes included
+        branch.remove_file(get_cached_object_or_404(File, 2))
+        with self.assertRaises(Http404):
+            get_cached_object_or_404(File, 2)
+        get_cached_object_or_404(File, 3)
+        Branch.objects.get(id=2).delete()
+        with self.assertRaises(Http404):
+            get_cached_object_or_404(File, 3)
+
+    def test_fragment_generations(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        self.client.get(reverse('single_branch', args=(1,)))
+        # session, user and its permissions, the branch and its files come from the cache
+        with self.assertNumQueries(4):
+            self.client.get(reverse('single_branch', args=(1,)))
+        Branch.objects.get(id=1).add_file('Fragment file', 'Fragment text')
+        self.assertContains(self.client.get(reverse('single_branch', args=(1,))), 'Fragment file')
+
+        self.client.get(reverse('commits', args=(1,)))
+        Commit(log_message='Fragment commit', date_time=timezone.now(), branch_id=1, committer='user1').save()
+        self.assertContains(self.client.get(reverse('commits', args=(1,))), 'Fragment commit')
+
+        self.client.get(reverse('single_project', args=(1,)))
+        Branch(name='Fragment branch', default=False, project_id=1).save()
+        self.assertContains(self.client.get(reverse('single_project', args=(1,))), 'Fragment branch')
+
+    def test_view_query_counts(self):
+        profile = profile_views([1, 3])
+        self.assertEqual(growing_views(profile), [])
+
+        # a changed count means query_baseline.json has to be regenerated with profile_views --baseline
+        with open(BASELINE) as baseline:
+            baseline = json.load(baseline)
+        smallest = str(baseline['scales'][0])
+        for counted in COUNTED:
+            self.assertEqual({name: counts['1'][counted] for name, counts in profile['views'].items()},
+                             {name: counts[smallest][counted] for name, counts in baseline['views'].items()})
+
+    def test_branch_archive(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        response = self.client.get(reverse('branch_archive', args=(1, 'zip')))
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ['File 1', 'File 2', 'File 6'])
+            self.assertEqual(archive.read('File 2'), b'Generic text for file 2 on branch 1')
+        response = self.client.get(reverse('branch_archive', args=(1, 'zip')), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse('branch_archive', args=(1, 'tar.gz')))
+        archived = b''.join(response.streaming_content)
+        with tarfile.open(fileobj=io.BytesIO(archived)) as archive:
+            self.assertEqual(archive.getnames(), ['File 1', 'File 2', 'File 6'])
+            self.assertEqual(archive.extractfile('File 6').read(), b'Generic text for file 6 on branch 1')
+        # the unchanged branch is served from the cache
+        response = self.client.get(reverse('branch_archive', args=(1, 'tar.gz')))
+        self.assertEqual(b''.join(response.streaming_content), archived)
+
+    def test_upload_file(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        text = 'Uploaded line\n' * 10000
+        upload = SimpleUploadedFile('uploaded.txt', text.encode())
+        self.client.post(reverse('upload_file', args=(1,)), {'file': upload}, follow=True)
+        branch = Branch.objects.get(id=1)
+        self.assertEqual(branch.get_file_by_title('uploaded.txt').blob.read(), text)
+
+        upload = SimpleUploadedFile('File 1', b'Uploaded over file 1')
+        self.client.post(reverse('upload_file', args=(1,)), {'file': upload}, follow=True)
+        self.assertEqual(branch.get_file_by_title('File 1').blob.read(), 'Uploaded over file 1')
+
+        upload = SimpleUploadedFile('image.png', b'\x89PNG\r\n\x1a\n\xff')
+        response = self.client.post(reverse('upload_file', args=(1,)), {'file': upload}, follow=True)
+        self.assertEqual(response.status_code, 400)
+
+        upload = SimpleUploadedFile('long' * 30 + '.txt', b'Uploaded under a long name')
+        response = self.client.post(reverse('upload_file', args=(1,)), {'file': upload}, follow=True)
+        self.assertEqual(response.status_code, 400)
+
     def test_contributors_successful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -491,6 +717,15 @@ class InitialTests(TestCase):
         self.assertEqual(len(response.context['contributors']), 2)
         self.assertEqual(len(response.context['other_users']), 4)
 
+    def test_contributor_candidates(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        response = self.client.get(reverse('contributor_candidates', args=(1,)), {'q': 'user'})
+        self.assertEqual(response.json()['users'], ['user2', 'user3', 'user6'])
+        response = self.client.get(reverse('contributor_candidates', args=(1,)), {'q': 'user3'})
+        self.assertEqual(response.json()['users'], ['user3'])
+
     def test_contributors_unsuccessful(self):
         context = {'uname': 'user2', 'psw': 'user2'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -546,6 +781,71 @@ class InitialTests(TestCase):
         self.assertEqual(comments1[1]['reaction'], 'LIKE')
         self.assertEqual(comments1[2]['reaction'], 'DISLIKE')
 
+    def test_get_comments_query_count(self):
+        project = Project.objects.get(id=1)
+        user = GitUser.objects.get_by_natural_key('user1')
+        for i in range(20):
+            Comment(text='Comment ' + str(i), last_update=timezone.now(), user=user, project=project).save()
+
+        with self.assertNumQueries(1):
+            comments = project.get_comments('user1')
+            for comment in comments:
+                self.assertIsNotNone(comment['comment'].user.username)
+
+    def test_comments_pages(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        project = Project.objects.get(id=1)
+        user = GitUser.objects.get_by_natural_key('user1')
+        same_time = timezone.now()
+        for i in range(25):
+            Comment(text='Comment ' + str(i), last_update=same_time, user=user, project=project).save()
+        total = len(Comment.objects.filter(project=project))
+
+        response = self.client.get(reverse('single_project', args=(1,)))
+        first_page = response.context['comments']
+        self.assertEqual(len(first_page), 20)
+        response = self.client.get(reverse('project_comments', args=(1,)),
+                                   {'before': response.context['next_comments']})
+        second_page = response.json()['comments']
+        self.assertEqual(len(second_page), total - 20)
+        self.assertIsNone(response.json()['next'])
+
+        shown = [comment['comment'].id for comment in first_page] + [comment['id'] for comment in second_page]
+        self.assertEqual(len(set(shown)), total)
+
+        # a cursor that isn't a comment of the project, like a deleted one, starts over from the first page
+        for cursor in [Comment.objects.exclude(project=project).first().id, 99999]:
+            response = self.client.get(reverse('project_comments', args=(1,)), {'before': cursor})
+            self.assertEqual([comment['id'] for comment in response.json()['comments']],
+                             [comment['comment'].id for comment in first_page])
+
+    def test_single_project_queries(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+        self.client.get(reverse('single_project', args=(1,)))
+
+        user = GitUser.objects.get_by_natural_key('user1')
+        fork = Project(title='Fork', lead=GitUser.objects.get_by_natural_key('user2'),
+                       forked_from=Project.objects.get(id=1))
+        fork.save()
+        fork.add_contributor(user)
+        user.add_starred(fork.id)
+        for i in range(30):
+            Branch(name='Branch ' + str(i), default=i == 0, project=fork).save()
+            Comment(text='Comment ' + str(i), last_update=timezone.now(), user=user, project=fork).save()
+
+        # session, user and its permissions, then the project, its branches and the comments
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('single_project', args=(fork.id,)))
+        self.assertTrue(response.context['starred'])
+        self.assertFalse(response.context['watched'])
+        self.assertTrue(response.context['can_edit'])
+        self.assertTrue(response.context['can_fork'])
+        self.assertContains(response, 'user1/' + Project.objects.get(id=1).title)
+        self.assertContains(response, 'Branch 29')
+
     def test_add_comment_successful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -557,6 +857,17 @@ class InitialTests(TestCase):
         self.assertTrue(len(project.get_comments('user1')) > size_before)
         self.assertEqual(project.get_comments('user1')[0]['comment'].text, 'Generic new comment')
 
+    def test_add_comment_after_delete(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        # new comment must not reuse the id of an existing one
+        Comment.objects.get(id=1).delete()
+        size_before = len(Comment.objects.all())
+        context = {'new_comment': 'Generic new comment'}
+        self.client.post(reverse('add_comment', args=(1, )), context, follow=True)
+        self.assertEqual(len(Comment.objects.all()), size_before + 1)
+
     def test_add_comment_unsuccessful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -601,9 +912,40 @@ class InitialTests(TestCase):
     def test_project_can_edit(self):
         project = Project.objects.get(id=1)
 
-        self.assertTrue(project.can_edit('user1'))
-        self.assertTrue(project.can_edit('user4'))
-        self.assertFalse(project.can_edit('user2'))
+        self.assertTrue(project.can_edit(GitUser.objects.get(username='user1')))
+        self.assertTrue(project.can_edit(GitUser.objects.get(username='user4')))
+        self.assertFalse(project.can_edit(GitUser.objects.get(username='user2')))
+
+    def test_project_can_edit_cached(self):
+        project = Project.objects.get(id=1)
+        user2 = GitUser.objects.get(username='user2')
+        with self.assertNumQueries(1):
+            self.assertFalse(project.can_edit(user2))
+            self.assertFalse(project.can_edit(user2))
+        with self.assertNumQueries(0):
+            self.assertFalse(Project(id=1).can_edit(user2))
+
+        project.add_contributor(user2)
+        self.assertTrue(Project.objects.get(id=1).can_edit(user2))
+        project.remove_contributor(user2)
+        self.assertFalse(Project.objects.get(id=1).can_edit(user2))
+
+    def test_project_can_edit_username_taken_again(self):
+        # user4 contributes to project 1, its cached answer must not pass to a new owner of the name
+        user4 = GitUser.objects.get(username='user4')
+        self.assertTrue(Project.objects.get(id=1).can_edit(user4))
+        user4.username = 'user4_renamed'
+        user4.save()
+        impostor = GitUser.objects.create_user('user4', 'impostor@mailinator.com', 'user4')
+        self.assertFalse(Project.objects.get(id=1).can_edit(impostor))
+        self.assertTrue(Project.objects.get(id=1).can_edit(user4))
+
+        # ids of deleted users can come back on databases that reuse the largest one
+        user_id = user4.pk
+        user4.delete()
+        reused = GitUser.objects.create_user('user4_reused', 'reused@mailinator.com', 'user4', id=user_id)
+        self.assertFalse(Project.objects.get(id=1).can_edit(reused))
+        self.assertFalse(Project.objects.get(id=1).can_edit(impostor))
 
     def test_project_get_issues(self):
         project = Project.objects.get(id=1)
@@ -631,6 +973,87 @@ class InitialTests(TestCase):
         milestone = Milestone.objects.get(id=3)
         self.assertEqual(milestone.get_percent(), 0)
 
+    def test_migrations_match_models(self):
+        # the committed migrations are the same on every database, vendor specific indexes are made by 0002
+        call_command('makemigrations', 'GitJS', '--check', '--dry-run', stdout=StringIO())
+
+    def test_counters(self):
+        def recounted():
+            output = StringIO()
+            call_command('recount', stdout=output)
+            return output.getvalue()
+
+        self.assertEqual(recounted().count(' 0 of '), 3)
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+        self.client.post(reverse('add_branch', args=(1,)), {'new_branch': 'Counted'})
+        self.client.post(reverse('delete_branch', args=(2,)))
+        self.client.post(reverse('add_issue', args=(1,)), {'new_title': 'Counted', 'new_desc': 'Counted',
+                                                            'assignee': 'None', 'milestone': 'Milestone 1'})
+        self.client.post(reverse('toggle_issue', args=(1,)))
+        self.client.post(reverse('toggle_request_state', args=(1,)))
+        self.client.get(reverse('add_starred', args=(3,)))
+        self.client.get(reverse('add_watched', args=(3,)))
+        self.client.get(reverse('remove_watched', args=(3,)))
+        self.client.get(reverse('fork', args=(3,)))
+        GitUser.objects.get_by_natural_key('user2').delete()
+        self.assertEqual(recounted().count(' 0 of '), 3)
+        self.assertEqual(Milestone.objects.get(id=1).get_percent(), 50)
+
+        Project.objects.filter(id=1).update(star_count=99)
+        self.assertIn('project counters: 1 of', recounted())
+        self.assertEqual(Project.objects.get(id=1).star_count, StarredProject.objects.filter(project_id=1).count())
+
+        # a star deleted twice, as by two requests that both loaded it, is taken off the count once
+        starred = StarredProject.objects.filter(project_id=1).first()
+        StarredProject.objects.get(id=starred.id).delete()
+        starred.delete()
+        self.assertEqual(Project.objects.get(id=1).star_count, StarredProject.objects.filter(project_id=1).count())
+
+    def test_milestone_pages(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+        project = Project.objects.get(id=1)
+        now = timezone.now()
+        for i in range(FEED_PAGE_SIZE + 5):
+            # due dates repeat, the pages are ordered by id within them
+            Milestone(title='Paged ' + str(i), description='Paged', due_date=now + datetime.timedelta(days=3 - i % 3),
+                      state='OPEN', project=project).save()
+
+        def pages(name, args):
+            shown = []
+            after = None
+            while True:
+                response = self.client.get(reverse(name, args=args), {'after': after} if after else {})
+                shown += response.context['milestones']
+                after = response.context['next_milestones']
+                if after is None:
+                    return [milestone.id for milestone in shown]
+
+        ordered = Milestone.objects.filter(project=project, state='OPEN').order_by('due_date', 'id')
+        self.assertEqual(pages('milestones', (1, 'OPEN')), [milestone.id for milestone in ordered])
+        response = self.client.get(reverse('milestones', args=(1, 'OPEN')), {'after': 99999})
+        self.assertEqual([milestone.id for milestone in response.context['milestones']],
+                         [milestone.id for milestone in ordered[:FEED_PAGE_SIZE]])
+        # adding or editing one leads to the first page of the same list
+        due_date = (now + datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+        context = {'new_title': 'Paged added', 'new_desc': 'Paged', 'due_date': due_date}
+        response = self.client.post(reverse('add_milestone', args=(1,)), context)
+        self.assertRedirects(response, reverse('milestones', args=(1, 'OPEN')))
+        added = Milestone.objects.get(title='Paged added')
+        context = {'new_title': 'Paged edited', 'new_desc': 'Paged', 'due_date': due_date}
+        response = self.client.post(reverse('edit_milestone', args=(added.id,)), context, follow=True)
+        self.assertEqual(response.redirect_chain, [(reverse('milestones', args=(1, 'OPEN')), 302)])
+        self.assertEqual(len(response.context['milestones']), FEED_PAGE_SIZE)
+        self.assertIsNotNone(response.context['next_milestones'])
+        user = GitUser.objects.get_by_natural_key('user1')
+        upcoming = [milestone.id for milestone in Milestone.objects.filter(state='OPEN', due_date__gte=now)
+                    .order_by('due_date', 'id')
+                    if milestone.project.lead_id == user.pk or
+                    milestone.project.get_contributors().filter(user_id=user.pk).exists()]
+        self.assertIn(Milestone.objects.filter(title='Paged 0').get().id, upcoming)
+        self.assertEqual(pages('upcoming_milestones', ()), upcoming)
+
     def test_add_issue_successful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -718,6 +1141,35 @@ class InitialTests(TestCase):
         self.assertEqual(commits[1].log_message, 'File File 2 added')
         self.assertEqual(commits[2].log_message, 'File File 6 added')
 
+    def test_commit_count_and_pages(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+        branch = Branch.objects.get(id=1)
+        self.assertEqual(branch.commit_count, branch.get_commits().count())
+
+        self.client.post(reverse('add_file', args=(1,)), {'new_title': 'Counted', 'new_text': 'Text'})
+        branch.refresh_from_db()
+        self.assertEqual(branch.commit_count, branch.get_commits().count())
+        copy = branch.copy('Counted copy', branch.project)
+        self.assertEqual(copy.commit_count, branch.get_commits().count())
+        # renaming a branch read before the commit keeps the count
+        self.client.post(reverse('edit_branch', args=(1,)), {'new_branch': 'Renamed'})
+        self.assertEqual(Branch.objects.get(id=1).commit_count, branch.commit_count)
+
+        now = timezone.now()
+        for i in range(FEED_PAGE_SIZE + 5):
+            Commit(log_message='Paged', date_time=now, branch=branch, committer='user1').save()
+        shown = []
+        before = None
+        while True:
+            response = self.client.get(reverse('commits', args=(1,)), {'before': before} if before else {})
+            page = list(response.context['commits'])
+            shown += page
+            if 'Older commits' not in response.content.decode():
+                break
+            before = page[-1].id
+        self.assertEqual([commit.id for commit in shown], [commit.id for commit in branch.get_commits()])
+
     def test_get_add_file_commit(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -774,6 +1226,10 @@ class InitialTests(TestCase):
         self.assertEqual(len(other_requests), 2)
         self.assertEqual(other_requests[0].title, 'Merged req')
         self.assertEqual(other_requests[1].title, 'Closed pr 2')
+        # the list shows the branches and issue of every request, they come with the same query
+        with self.assertNumQueries(1):
+            self.assertEqual([pr.source.name + pr.target.name for pr in project.get_pull_requests('OPEN')],
+                             [pr.source.name + pr.target.name for pr in open_requests])
 
     def test_get_files(self):
         branch = Branch.objects.get(id=1)
@@ -790,14 +1246,14 @@ class InitialTests(TestCase):
     def test_get_file_by_title(self):
         branch = Branch.objects.get(id=1)
         self.assertEqual(branch.get_file_by_title('File 1').title, 'File 1')
-        self.assertEqual(branch.get_file_by_title('File 1').text, 'Generic text for file 1 on branch 1')
+        self.assertEqual(branch.get_file_by_title('File 1').blob.read(), 'Generic text for file 1 on branch 1')
         self.assertEqual(branch.get_file_by_title('File 2').title, 'File 2')
         self.assertIsNone(branch.get_file_by_title('File 3'))
 
         # in the case of several branches having a file with the same name
         branch = Branch.objects.get(id=2)
         self.assertEqual(branch.get_file_by_title('File 1').title, 'File 1')
-        self.assertEqual(branch.get_file_by_title('File 1').text, 'Generic text for file 1 on branch 2')
+        self.assertEqual(branch.get_file_by_title('File 1').blob.read(), 'Generic text for file 1 on branch 2')
         self.assertIsNone(branch.get_file_by_title('File 2'))
 
     def test_get_differences(self):
@@ -811,11 +1267,61 @@ class InitialTests(TestCase):
         self.assertEqual(differences[1][1], 'Generic text for file 2 on branch 1')
         self.assertEqual(differences[2][1], 'Generic text for file 6 on branch 1')
 
+    def test_get_file_diffs(self):
+        pr = PullRequest.objects.select_related('source', 'target').get(id=1)
+        with self.assertNumQueries(3):
+            diffs = pr.get_file_diffs()
+        self.assertEqual([diff['state'] for diff in diffs], ['changed', 'added', 'added'])
+        self.assertEqual(diffs[0]['lines'], [('hunk', '@@ -1 +1 @@'),
+                                             ('removed', '-Generic text for file 1 on branch 2'),
+                                             ('added', '+Generic text for file 1 on branch 1')])
+
+        Branch.objects.get(id=2).add_file('File 6', 'Generic text for file 6 on branch 1')
+        diffs = pr.get_file_diffs()
+        self.assertEqual([diff['state'] for diff in diffs], ['changed', 'added', 'unchanged'])
+
+    def test_merge_changes(self):
+        context = {'uname': 'user1', 'psw': 'user1'}
+        self.client.post('http://localhost:8000/login/', context, follow=True)
+
+        response = self.client.get(reverse('get_merge_changes', args=(1,)))
+        self.assertEqual(len(response.context['changes']), 3)
+        self.assertContains(response, '+Generic text for file 6 on branch 1')
+
+    def test_file_blobs(self):
+        branch = Branch.objects.get(id=2)
+        blobs_before = len(Blob.objects.all())
+        first = branch.add_file('Copy of file 2', 'Generic text for file 2 on branch 1')
+        self.assertEqual(first.blob_id, File.objects.get(id=2).blob_id)
+        self.assertEqual(len(Blob.objects.all()), blobs_before)
+
+        text = 'A line of a large file\n' * 10000
+        large = branch.add_file('Large', text)
+        blob = Blob.objects.get(sha256=large.blob_id)
+        self.assertIsNotNone(blob.data)
+        self.assertTrue(len(blob.data) < len(text))
+        self.assertEqual(File.objects.get(id=large.id).blob.read(), text)
+        self.assertEqual(b''.join(blob.chunks(1000)), text.encode())
+        # without the data loaded with the row, it is read a slice per query
+        streamed = Blob.objects.defer('data').get(sha256=large.blob_id)
+        with self.assertNumQueries(len(blob.data) // 1000 + 1):
+            self.assertEqual(b''.join(streamed.chunks(1000)), text.encode())
+
+    def test_search_compressed_blobs(self):
+        # text kept compressed is left out of the table scans and only found through the word index
+        branch = Branch.objects.get(id=2)
+        large = branch.add_file('Large', 'Unusualword in a large file\n' * 10000)
+        self.assertIsNotNone(Blob.objects.get(sha256=large.blob_id).data)
+        self.assertEqual(search('files', 'unusualword'), [])
+        with override_settings(SEARCH_INDEX=True):
+            call_command('rebuild_search_index', '--kind', 'files', stdout=StringIO())
+            self.assertEqual([file.id for file in search('files', 'unusualword')], [large.id])
+
     def test_merge_branches(self):
         pr = PullRequest.objects.get(id=1)
         branch_before = Branch.objects.get(id=2)
         self.assertEqual(len(branch_before.get_files()), 1)
-        self.assertEqual(branch_before.get_files()[0].text, 'Generic text for file 1 on branch 2')
+        self.assertEqual(branch_before.get_files()[0].blob.read(), 'Generic text for file 1 on branch 2')
         self.assertIsNone(branch_before.get_file_by_title('File 2'))
         self.assertIsNone(branch_before.get_file_by_title('File 6'))
 
@@ -823,10 +1329,30 @@ class InitialTests(TestCase):
 
         branch_after = Branch.objects.get(id=2)
         self.assertEqual(len(branch_after.get_files()), 3)
-        self.assertEqual(branch_after.get_files()[0].text, 'Generic text for file 1 on branch 1')
+        self.assertEqual(branch_after.get_files()[0].blob.read(), 'Generic text for file 1 on branch 1')
         self.assertIsNotNone(branch_after.get_file_by_title('File 2'))
         self.assertIsNotNone(branch_after.get_file_by_title('File 6'))
 
+    def test_merge_branches_into_copy(self):
+        # the target's own files are shared with a copy, which has to keep seeing the old texts
+        target = Branch.objects.get(id=2)
+        source = Branch.objects.get(id=1)
+        target.add_file('File 2', 'Old text')
+        target.remove_file(target.get_file_by_title('File 1'))
+        copy = target.copy('Copy', target.project)
+        pr = PullRequest(title='Into copied', description='', state='OPEN', project=target.project,
+                         source=source, target=target)
+        pr.save()
+
+        # the target's lock included
+        with self.assertNumQueries(11):
+            summary = pr.merge_branches()
+        self.assertEqual(summary, {'added': 2, 'modified': 1, 'unchanged': 0})
+        self.assertEqual([(file.title, file.blob.read()) for file in target.get_files()],
+                         [(file.title, file.blob.read()) for file in source.get_files()])
+        self.assertEqual([(file.title, file.blob.read()) for file in copy.get_files()], [('File 2', 'Old text')])
+        self.assertEqual(pr.merge_branches(), {'added': 0, 'modified': 0, 'unchanged': 3})
+
     def test_add_pull_request_successful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -978,6 +1504,13 @@ class InitialTests(TestCase):
         self.assertEqual(my_projects[1].title, 'Project 3')
         self.assertEqual(my_projects[1].lead.username, user.username)
 
+    def test_get_my_projects_pages(self):
+        user = GitUser.objects.get(username='user6')
+        with self.assertNumQueries(1):
+            titles = [project.lead.username + project.title for project in user.get_my_projects()]
+        self.assertEqual(titles, ['user5Project 2', 'user6Project 3'])
+        self.assertEqual([project.title for project in user.get_my_projects(after=2)], ['Project 3'])
+
     def test_add_project_successful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -1045,12 +1578,75 @@ class InitialTests(TestCase):
         self.assertTrue(len(Branch.objects.all()), branch_size_before)
         for i in range(0, len(file_list_before)):
             self.assertEqual(file_list_before[i].title, file_list_after[i].title)
-            self.assertEqual(file_list_before[i].text, file_list_after[i].text)
+            self.assertEqual(file_list_before[i].blob.read(), file_list_after[i].blob.read())
         for i in range(0, len(commit_list_before)):
             self.assertEqual(commit_list_before[i].log_message, commit_list_after[i].log_message)
             self.assertEqual(commit_list_before[i].date_time, commit_list_after[i].date_time)
             self.assertEqual(commit_list_before[i].committer, commit_list_after[i].committer)
 
+    def test_copy_branch_shares_files(self):
+        branch = Branch.objects.get(id=1)
+        files_before = len(File.objects.all())
+        commits_before = len(Commit.objects.all())
+        copy = branch.copy('Copied branch', branch.project)
+        self.assertEqual(len(File.objects.all()), files_before)
+        self.assertEqual(len(Commit.objects.all()), commits_before)
+        self.assertEqual(len(copy.get_files()), len(branch.get_files()))
+        self.assertEqual(len(copy.get_commits()), len(branch.get_commits()))
+
+        # changes made on either side after copying stay on that side
+        branch.change_file(branch.get_file_by_title('File 1'), 'File 1', 'Changed on source')
+        branch.add_file('Source only', 'text')
+        copy.change_file(copy.get_file_by_title('File 2'), 'File 2 renamed', 'Changed on copy')
+        copy.remove_file(copy.get_file_by_title('File 6'))
+
+        self.assertEqual(copy.get_file_by_title('File 1').blob.read(), 'Generic text for file 1 on branch 1')
+        self.assertIsNone(copy.get_file_by_title('Source only'))
+        self.assertIsNone(copy.get_file_by_title('File 2'))
+        self.assertIsNone(copy.get_file_by_title('File 6'))
+        self.assertEqual(len(copy.get_files()), 2)
+        self.assertEqual(branch.get_file_by_title('File 1').blob.read(), 'Changed on source')
+        self.assertEqual(branch.get_file_by_title('File 2').blob.read(), 'Generic text for file 2 on branch 1')
+        self.assertIsNotNone(branch.get_file_by_title('File 6'))
+        self.assertIsNone(branch.get_file_by_title('File 2 renamed'))
+
+        # copies of copies keep their view when the original branch is deleted
+        second_copy = copy.copy('Second copy', copy.project)
+        source_commits = len(branch.get_commits())
+        branch.delete()
+        copy = Branch.objects.get(id=copy.id)
+        second_copy = Branch.objects.get(id=second_copy.id)
+        self.assertIsNone(copy.parent)
+        for checked in [copy, second_copy]:
+            self.assertEqual(checked.get_file_by_title('File 1').blob.read(), 'Generic text for file 1 on branch 1')
+            self.assertEqual(checked.get_file_by_title('File 2 renamed').blob.read(), 'Changed on copy')
+            self.assertEqual(len(checked.get_files()), 2)
+            self.assertEqual(len(checked.get_commits()), source_commits)
+
+    def test_copy_of_copy_files(self):
+        branch = Branch.objects.get(id=1)
+        copy = branch.copy('Copy', branch.project)
+        copy.change_file(copy.get_file_by_title('File 1'), 'File 1', 'Changed on copy')
+        second_copy = copy.copy('Second copy', copy.project)
+        second_copy.remove_file(second_copy.get_file_by_title('File 2'))
+        # a copy sees its parent's rows up to the newest one the parent had, taken under the parent's lock
+        self.assertEqual(second_copy.base_file_id, copy.get_file_by_title('File 1').id)
+
+        # every title comes from the closest layer that has it, one NOT EXISTS decides it for all of them
+        files = second_copy.get_files()
+        self.assertEqual(str(files.query).count('EXISTS'), 1)
+        self.assertEqual([(file.title, file.blob.read()) for file in files],
+                         [('File 6', 'Generic text for file 6 on branch 1'), ('File 1', 'Changed on copy')])
+
+    def test_replaced_file_removed_while_copied(self):
+        branch = Branch.objects.get(id=1)
+        copy = branch.copy('Copy', branch.project)
+        branch.change_file(branch.get_file_by_title('File 1'), 'File 1', 'Changed')
+        # the replacing row goes, the row it replaced stays hidden from the branch
+        branch.remove_file(branch.get_file_by_title('File 1'))
+        self.assertIsNone(branch.get_file_by_title('File 1'))
+        self.assertEqual(copy.get_file_by_title('File 1').blob.read(), 'Generic text for file 1 on branch 1')
+
     def test_copy_branch_unsuccessful(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -1069,6 +1665,41 @@ class InitialTests(TestCase):
         response = self.client.post(reverse('copy_branch', args=(3,)), context, follow=True)
         self.assertEqual(response.context['error_message'], "Branch name already exists")
 
+    def test_search_file_contents(self):
+        files = search('files', 'branch 6')
+        # both words anywhere in the file, files mentioning 6 in title and text first
+        self.assertEqual([file.id for file in files], [9, 10, 7, 8, 12])
+        files = search('files', 'file 4')
+        self.assertEqual([file.id for file in files], [6, 7, 5])
+        self.assertEqual(search('files', 'file', page=2), [])
+
+    def test_search_or(self):
+        files = [file.id for file in search('files', 'branch or 6')]
+        self.assertEqual(set(files), {file.id for file in search('files', 'branch')} |
+                         {file.id for file in search('files', '6')})
+        self.assertEqual(files[:5], [9, 10, 7, 8, 12])
+        with override_settings(SEARCH_INDEX=True):
+            call_command('rebuild_search_index', stdout=StringIO())
+            self.assertEqual([file.id for file in search('files', 'branch OR 6')], files)
+            # scored, ordered and paged by the database, however many files match
+            with self.assertNumQueries(1):
+                search('files', 'branch or 6 or file', page=2)
+
+    @override_settings(SEARCH_INDEX=True)
+    def test_search_index(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual([file.id for file in search('files', 'branch 6')], [9, 10, 7, 8, 12])
+
+        branch = Branch.objects.get(id=6)
+        branch.change_file(File.objects.get(id=12), 'File 8', 'Moved to another branch')
+        self.assertEqual([file.id for file in search('files', 'branch 6')], [9, 10, 7, 8])
+        self.assertEqual([file.id for file in search('files', 'another')], [12])
+
+        comment = Comment.objects.get(id=1)
+        self.assertEqual(search('comments', 'comment 1'), [comment])
+        comment.delete()
+        self.assertEqual(len(SearchPosting.objects.filter(kind='comments', object_id=1)), 0)
+
     def test_search_app(self):
         context = {'uname': 'user1', 'psw': 'user1'}
         self.client.post('http://localhost:8000/login/', context, follow=True)
@@ -1085,10 +1716,10 @@ class InitialTests(TestCase):
             self.assertTrue(search_value.strip() in branch.name)
         self.assertIsNotNone(response.context['issues'])
         for issue in response.context['issues']:
-            self.assertTrue(search_value.strip() in issue.title)
+            self.assertTrue(search_value.strip() in issue.title + ' ' + issue.description)
         self.assertIsNotNone(response.context['files'])
         for file in response.context['files']:
-            self.assertTrue(search_value.strip() in file.title)
+            self.assertTrue(search_value.strip() in file.title + ' ' + file.blob.read())
 
         search_value = '  ect  '
         context = {'search_value': search_value, 'include_projects': True, 'include_branches': True,
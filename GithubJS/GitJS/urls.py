@@ -6,9 +6,11 @@ from . import views, project_views, branch_views, milestone_views, file_views, \
 urlpatterns = [
     path("", views.index, name="index"),
     path("<int:project_id>/", project_views.single_project, name="single_project"),
+    path("<int:project_id>/comments", project_views.project_comments, name="project_comments"),
     path("add_project", project_views.add_project, name="add_project"),
     path("delete_project/<int:project_id>", project_views.delete_project, name="delete_project"),
     path("branch/<int:branch_id>", file_views.single_branch, name="single_branch"),
+    path("branch/<int:branch_id>/archive/<str:archive_format>", file_views.branch_archive, name="branch_archive"),
     path("<int:project_id>/add_branch/", branch_views.add_branch, name="add_branch"),
     path("delete_branch/<int:branch_id>", branch_views.delete_branch, name="delete_branch"),
     path("edit_branch/<int:branch_id>", branch_views.edit_branch, name="edit_branch"),
@@ -26,16 +28,22 @@ urlpatterns = [
     path('start_watch/<int:project_id>', project_views.add_watched, name='add_watched'),
     path('stop_watch/<int:project_id>', project_views.remove_watched, name='remove_watched'),
     path('my_watched/', project_views.watched_project_changes, name='my_watched'),
+    path('my_watched/feed', project_views.watched_project_changes_feed, name='my_watched_feed'),
     path('fork/<int:project_id>', project_views.fork_project, name='fork'),
     path('my_projects', project_views.my_projects, name='my_projects'),
     path('milestones/<int:project_id>/<str:state>', milestone_views.get_milestones, name='milestones'),
     path('<int:project_id>/add_milestone', milestone_views.add_milestone, name='add_milestone'),
     path('edit_milestone/<int:milestone_id>', milestone_views.edit_milestone, name='edit_milestone'),
     path('toggle_milestone/<int:milestone_id>', milestone_views.toggle_milestone_status, name='toggle_milestone'),
+    path('my_milestones', milestone_views.upcoming_milestones, name='upcoming_milestones'),
     path('<int:branch_id>/add_file', file_views.add_file, name='add_file'),
     path('edit_file/<int:file_id>', file_views.edit_file, name='edit_file'),
     path('delete_file/<int:file_id>', file_views.delete_file, name='delete_file'),
+    path('raw_file/<int:file_id>', file_views.raw_file, name='raw_file'),
+    path('<int:branch_id>/upload_file', file_views.upload_file, name='upload_file'),
     path('contributors/<int:project_id>', project_views.contributors, name='contributors'),
+    path('contributors/<int:project_id>/candidates', project_views.contributor_candidates,
+         name='contributor_candidates'),
     path('add_contributor/<int:project_id>', project_views.add_contributor, name='add_contributor'),
     path('remove_contributor/<int:project_id>/<str:username>', project_views.remove_contributor,
          name='remove_contributor'),
@@ -130,11 +130,23 @@ STATIC_URL = '/static/'
 
 STATIC_ROOT = '../static/'
 
+# How watched project changes are stored:
+# 'write' copies every change to each watcher (queued, see the deliver_updates command),
+# 'read' keeps one event per change and merges the watched projects' events when the feed is read.
+WATCHED_CHANGES_MODE = os.environ.get('UKS_WATCHED_CHANGES', 'write')
+
+# Keep the word index of file, issue, pull request and comment texts (see the rebuild_search_index command)
+# and answer searches from it instead of the database's own text search.
+SEARCH_INDEX = os.environ.get('UKS_SEARCH_INDEX', '') == 'ON'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache time to live is 15 minutes.
+CACHE_TTL = 60 * 15
+
 # !!! HACK !!!
 # The initial idea was to use sqlite for testing and postgres for "production".
 # To do this, prepend UKS_TEST_DB before linux command.
@@ -166,8 +178,6 @@ else:
         }
     }
 
-    # Cache time to live is 15 minutes.
-    CACHE_TTL = 60 * 15
     # store session in cache
     SESSION_ENGINE = "django.contrib.sessions.backends.cache"
     SESSION_CACHE_ALIAS = "default"
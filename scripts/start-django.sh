@@ -7,6 +7,8 @@ python3 manage.py collectstatic --noinput
 python3 manage.py makemigrations
 python3 manage.py migrate
 python3 manage.py fill_database
+# deliver project updates to watchers in the background
+python3 manage.py deliver_updates --loop &
 # run Django develop server
 #python3 manage.py runserver 0.0.0.0:8000
 # run Django app inside gunicorn